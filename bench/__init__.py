@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import tempfile
+
+### Benchmarks. ###
+#
+# The benchmarks are run from the top of the source tree, for example
+# `python3 -m bench.suite`. They use a temporary home directory, so
+# nothing is read from, or written to, the user's feed database.
+
+
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+'''
+:str  The directory with the program's modules
+'''
+
+
+def prepare(home = None):
+    '''
+    Make the program's modules importable, with the database in a temporary home
+    
+    This must be called before any of the program's modules are imported,
+    because the location of the database is looked up when they are
+    
+    @param   home:str?  The home directory to use, a new temporary directory if `None`
+    @return  :str       The home directory, the caller should remove it when done
+    '''
+    if home is None:
+        home = tempfile.mkdtemp(prefix = 'featherweight-bench-')
+    os.environ['HOME'] = home
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+    return home
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import time
+import datetime
+import email.utils
+
+from bench import SRC
+sys.path.insert(0, SRC)
+import dates
+
+### Correctness and speed of the publication date parser. ###
+#
+# Usage: python3 -m bench.bench_dates [ROUNDS]
+#
+# Every date in dates.corpus is checked against the standard library, and
+# the corpus is then parsed ROUNDS times, with and without the cache.
+# The exit value is non-zero if a date is wrong or a target is missed.
+
+
+
+TARGET_UNCACHED = 100000
+'''
+:int  The minimum number of dates per second to parse without the cache
+'''
+
+TARGET_CACHED = 1000000
+'''
+:int  The minimum number of dates per second to parse with the cache
+'''
+
+
+def reference(format, value):
+    '''
+    Parse a date with the standard library
+    
+    @param   format:str  'rss' or 'atom'
+    @param   value:str   The date
+    @return  :int        The date in seconds since the Epoch
+    '''
+    if format == 'rss':
+        return int(email.utils.mktime_tz(email.utils.parsedate_tz(value.replace(',', ', '))))
+    value = value.strip().upper().replace('Z', '+00:00')
+    if len(value) > 10:
+        value = value[:10] + 'T' + value[11:]
+    (date, _, clock) = value.partition('T')
+    zone = ''
+    for sign in '+-':
+        if sign in clock:
+            (clock, zone) = (clock.split(sign)[0], sign + clock.split(sign)[1])
+    if (len(zone) == 5) and (':' not in zone):
+        zone = zone[:3] + ':' + zone[3:]
+    clock = clock.split('.')[0]
+    if clock.count(':') == 1:
+        clock += ':00'
+    value = date + 'T' + (clock or '00:00:00') + (zone or '+00:00')
+    return int(datetime.datetime.fromisoformat(value).timestamp())
+
+
+def throughput(corpus, rounds, cached):
+    '''
+    Measure how fast dates are parsed
+    
+    @param   corpus:list<(str, str)>  The formats and the dates
+    @param   rounds:int               The number of times to parse the corpus
+    @param   cached:bool              Whether the cache may be used
+    @return  :float                   The number of dates per second
+    '''
+    parse = {'rss' : dates.rss_date, 'atom' : dates.atom_date}
+    corpus = [(parse[format], value) for (format, value) in corpus]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if not cached:
+            for entries in dates.cache.values():
+                entries.clear()
+        for (function, value) in corpus:
+            function(value)
+    return len(corpus) * rounds / (time.perf_counter() - start)
+
+
+def main(rounds):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dates.corpus'), 'r') as file:
+        corpus = [line.rstrip('\n').split('\t', 1) for line in file if not line.startswith('#')]
+    
+    failures = 0
+    for (format, value) in corpus:
+        got = (dates.rss_date if format == 'rss' else dates.atom_date)(value)
+        expected = reference(format, value)
+        if got != expected:
+            failures += 1
+            print('%s %r: got %r, expected %r' % (format, value, got, expected))
+    print('correct: %i of %i' % (len(corpus) - failures, len(corpus)))
+    
+    uncached = throughput(corpus, rounds, False)
+    cached = throughput(corpus, rounds, True)
+    print('uncached: %.0f dates/s (target %i)' % (uncached, TARGET_UNCACHED))
+    print('cached: %.0f dates/s (target %i)' % (cached, TARGET_CACHED))
+    
+    return 0 if failures == 0 and uncached >= TARGET_UNCACHED and cached >= TARGET_CACHED else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import time
+
+from bench import prepare
+
+### Correctness and speed of the HTML renderer. ###
+#
+# Usage: python3 -m bench.bench_render [ROUNDS]
+#
+# Every article in `CASES` is rendered and compared with its expected
+# text, and all of them, as one article, are then rendered ROUNDS times.
+# The exit value is non-zero if an article is wrong or the target is missed.
+
+# The database is placed in a temporary home, before it is looked up.
+home = prepare()
+os.environ.pop('FEATHERWEIGHT_HTML', None)
+from renderer import render_html
+
+
+
+TARGET = 1 << 20
+'''
+:int  The minimum number of bytes of HTML per second to render
+'''
+
+WIDTH = 40
+'''
+:int  The width of the terminal to render for
+'''
+
+CASES = [
+    # Inline markup does not separate words.
+    ('<p>H<sub>2</sub>O is <em>very</em>, good.</p>',
+     'H2O is very, good.\n'),
+    ('<p>Un<b>bel</b>ievable, <i>isn\'t</i> <code>it</code>?</p>',
+     'Unbelievable, isn\'t it?\n'),
+    # Link notes are attached to the link text.
+    ('<p>See <a href="http://example.org/">this</a>. Or <a href="http://example.org/">that </a>one.</p>',
+     'See this[1]. Or that[1] one.\n\n[1] http://example.org/\n'),
+    ('<p><a href="http://example.org/">http://example.org/</a></p>',
+     'http://example.org/\n'),
+    # Whitespace is collapsed, but not in preformatted text.
+    ('<p>  one\n\t two  </p><pre>a  b\n  c</pre>',
+     'one two\n\na  b\n  c\n'),
+    ('<p>one<br>two</p>',
+     'one\ntwo\n'),
+    # Lines are filled to the width of the terminal.
+    ('<p>' + 'word ' * 10 + '</p>',
+     'word word word word word word word word\nword word\n'),
+    ('<ol><li>one</li><li>t<b>w</b>o</li></ol>',
+     '1. one\n2. two\n'),
+    ('<h1>Title</h1><blockquote>quoted <em>text</em></blockquote>',
+     'Title\n=====\n\n> quoted text\n'),
+]
+'''
+:list<(str, str)>  Articles, and the text they shall be rendered to
+'''
+
+
+def main(rounds):
+    failures = 0
+    for (html, expected) in CASES:
+        got = render_html(html.encode('utf-8'), WIDTH).decode('utf-8')
+        if got != expected:
+            failures += 1
+            print('%r: got %r, expected %r' % (html, got, expected))
+    print('correct: %i of %i' % (len(CASES) - failures, len(CASES)))
+    
+    html = ''.join(html for (html, _) in CASES).encode('utf-8') * 100
+    start = time.perf_counter()
+    for _ in range(rounds):
+        render_html(html, WIDTH)
+    speed = len(html) * rounds / (time.perf_counter() - start)
+    print('rendered: %.0f bytes/s (target %i)' % (speed, TARGET))
+    
+    return 0 if failures == 0 and speed >= TARGET else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20))
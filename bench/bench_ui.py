@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import pty
+import tty
+import json
+import time
+import fcntl
+import shutil
+import select
+import struct
+import termios
+import argparse
+import tempfile
+import subprocess
+
+from bench import prepare
+
+### End-to-end latency of the interactive session. ###
+#
+# Usage: python3 -m bench.bench_ui [--home HOME] [--groups N] [--feeds N] [--articles N]
+#                                  [--script FILE] [--rows N] [--columns N] [--output FILE]
+#
+# The feed tree is loaded, and interacted with, in a child process on a
+# pseudo-terminal, just as in a session, and a script of keystrokes is
+# sent to it one at a time. A keystroke's latency is the time from when
+# it is sent until the child waits for input again, with its screen
+# updated. Without --home, a database is generated with bench.database.
+# A database given with --home may be modified by the script.
+
+
+
+KEYS = { 'up'      : '\033[A',    'down'    : '\033[B',    'right'   : '\033[C',    'left'    : '\033[D',
+         'c-up'    : '\033[1;5A', 'c-down'  : '\033[1;5B', 'c-right' : '\033[1;5C', 'c-left'  : '\033[1;5D',
+         'space'   : ' ',         'enter'   : '\n',        'tab'     : '\t',        'c-l'     : '\014' }
+'''
+:dict<str, str>  Names of keys, that can be used in scripts, and the input they send
+'''
+
+DEFAULT_SCRIPT = '''
+down*40 up*20 c-down*5 c-up*5 c-left
+down*2 enter
+space down*100 up*50 n*5 p*5 c-l tab
+down*3 enter n*10 tab
+q
+'''
+'''
+:str  The script used if none is given: move around in the feed tree, open a feed,
+      expand all of its dates, move around in it, go back, open another feed,
+      and quit, branches with unread articles start expanded
+'''
+
+
+def parse_script(script):
+    '''
+    Parse a keystroke script
+    
+    The script is a whitespace separated list of keys, either names in
+    `KEYS` or single characters, each optionally followed by an asterisk
+    and the number of times to press it, as in `down*10`
+    
+    @param   script:str  The script
+    @return  :list<str>  The input for each keystroke
+    '''
+    keys = []
+    for word in script.split():
+        (key, _, count) = word.partition('*')
+        key = KEYS[key.lower()] if key.lower() in KEYS else key
+        if len(key) != 1 and key not in KEYS.values():
+            raise ValueError('unknown key: %s' % word)
+        keys.extend([key] * (int(count) if count else 1))
+    return keys
+
+
+def drive(signal_fd, rows, columns):
+    '''
+    Run a session, this is the child process, its terminal is the pseudo-terminal
+    
+    Each time the session waits for input, a byte is written to `signal_fd`
+    
+    @param  signal_fd:int  The write end of a pipe to the parent
+    @param  rows:int       The height of the terminal
+    @param  columns:int    The width of the terminal
+    '''
+    fcntl.ioctl(0, termios.TIOCSWINSZ, struct.pack('HHHH', rows, columns, 0, 0))
+    tty.setcbreak(0)
+    # Do not let articles, if the script opens any, wait for a pager.
+    os.environ['PAGER'] = 'true'
+    
+    import feeds
+    from common import root
+    from trees import Tree
+    from journal import Journal
+    
+    class InstrumentedTree(Tree):
+        '''
+        A tree that tells the parent when it waits for input
+        
+        Deferred work, such as writing read state, is not done when idle,
+        only when leaving the tree
+        '''
+        idle = property(lambda self : (0, lambda : os.write(signal_fd, b'.')),
+                        lambda self, value : None)
+    
+    # Used when feeds are opened too.
+    feeds.Tree = InstrumentedTree
+    
+    journal = Journal('%s/feeds' % root)
+    journal.load()
+    tree = InstrumentedTree('My Feeds', journal.index.feeds)
+    print('\033[?1049h\033[?25l', end = '', flush = True)
+    while True:
+        try:
+            (action, node) = tree.interact()
+        except EOFError:
+            break
+        if action == 'quit':
+            break
+        elif action == 'open':
+            if (node is None) or ('url' not in node) or (node['url'] is None):
+                continue
+            def update(new):
+                tree.count += new
+            if feeds.open_feed(node, update):
+                break
+            tree.draw_force = True
+
+
+def percentile(values, fraction):
+    '''
+    Get a percentile, by the nearest-rank method
+    
+    @param   values:list<float>  The values, sorted
+    @param   fraction:float      The percentile, as a fraction
+    @return  :float              The percentile
+    '''
+    return values[min(max(int(len(values) * fraction + 0.5) - 1, 0), len(values) - 1)]
+
+
+def run(home, keys, rows, columns):
+    '''
+    Run the script in a session
+    
+    @param   home:str             The home directory with the database
+    @param   keys:list<str>       The input for each keystroke
+    @param   rows:int             The height of the terminal
+    @param   columns:int          The width of the terminal
+    @return  :dict<str, _>        'startup', the seconds until the first input was waited
+                                  for, 'latencies' and 'bytes', the latency, in seconds, and
+                                  output, in bytes, of each keystroke, and 'startup_bytes'
+    '''
+    (read_end, write_end) = os.pipe()
+    start = time.perf_counter()
+    (pid, master) = pty.fork()
+    if pid == 0:
+        os.close(read_end)
+        status = 1
+        try:
+            prepare(home)
+            drive(write_end, rows, columns)
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write_end)
+    
+    output = [0, b'']
+    def wait():
+        # Read the output, until the child waits for input, or exits.
+        while True:
+            ready = select.select([master, read_end], [], [])[0]
+            if master in ready:
+                try:
+                    data = os.read(master, 1 << 16)
+                except OSError:
+                    data = b''
+                output[0] += len(data)
+                output[1] = (output[1] + data)[-4096:]
+            if read_end in ready:
+                waiting = len(os.read(read_end, 1)) > 0
+                # Get the rest of the output for the keystroke.
+                while len(select.select([master], [], [], 0)[0]) > 0:
+                    try:
+                        data = os.read(master, 1 << 16)
+                    except OSError:
+                        break
+                    if len(data) == 0:
+                        break
+                    output[0] += len(data)
+                    output[1] = (output[1] + data)[-4096:]
+                return waiting
+    
+    try:
+        if not wait():
+            raise Exception('session exited at startup:\n%s' % output[1].decode('utf-8', 'replace'))
+        result = {'startup' : time.perf_counter() - start, 'startup_bytes' : output[0],
+                  'latencies' : [], 'bytes' : []}
+        for key in keys:
+            output[0] = 0
+            sent = time.perf_counter()
+            os.write(master, key.encode('utf-8'))
+            waiting = wait()
+            result['latencies'].append(time.perf_counter() - sent)
+            result['bytes'].append(output[0])
+            if not waiting:
+                break
+        return result
+    finally:
+        os.close(read_end)
+        os.close(master)
+        os.waitpid(pid, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog = 'python3 -m bench.bench_ui')
+    parser.add_argument('--home', default = None, help = 'home directory with an existing database')
+    parser.add_argument('--groups', type = int, default = 10, help = 'number of groups, without --home')
+    parser.add_argument('--feeds', type = int, default = 10, help = 'number of feeds per group, without --home')
+    parser.add_argument('--articles', type = int, default = 1000, help = 'number of articles per feed, without --home')
+    parser.add_argument('--script', default = None, help = 'file with the keystrokes to send')
+    parser.add_argument('--rows', type = int, default = 50, help = 'terminal height')
+    parser.add_argument('--columns', type = int, default = 160, help = 'terminal width')
+    parser.add_argument('--output', default = None, help = 'file to write the results to, as JSON')
+    options = parser.parse_args()
+    
+    script = DEFAULT_SCRIPT
+    if options.script is not None:
+        with open(options.script, 'r') as file:
+            script = file.read()
+    keys = parse_script(script)
+    
+    home = options.home
+    if home is None:
+        home = tempfile.mkdtemp(prefix = 'featherweight-bench-')
+        subprocess.check_call([sys.executable, '-m', 'bench.database', home,
+                               '--groups', str(options.groups), '--feeds', str(options.feeds),
+                               '--articles', str(options.articles)])
+    try:
+        result = run(os.path.abspath(home), keys, options.rows, options.columns)
+    finally:
+        if options.home is None:
+            shutil.rmtree(home, ignore_errors = True)
+    
+    latencies = sorted(result['latencies'])
+    summary = { 'startup'     : result['startup'],
+                'keystrokes'  : len(latencies),
+                'p50'         : percentile(latencies, 0.50),
+                'p90'         : percentile(latencies, 0.90),
+                'p99'         : percentile(latencies, 0.99),
+                'max'         : latencies[-1],
+                'total_bytes' : result['startup_bytes'] + sum(result['bytes']) }
+    print('startup   %8.2f ms, %i bytes' % (summary['startup'] * 1000, result['startup_bytes']))
+    print('keystrokes %7i' % summary['keystrokes'])
+    for key in ('p50', 'p90', 'p99', 'max'):
+        print('%-9s %8.2f ms' % (key, summary[key] * 1000))
+    print('written   %8i bytes' % summary['total_bytes'])
+    if options.output is not None:
+        with open(options.output, 'w') as file:
+            json.dump(dict(result, summary = summary), file, indent = 2, sort_keys = True)
+            file.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import time
+import shutil
+
+from bench import prepare
+from bench.corpus import write_corpus
+
+### Scaling of `--update` with the number of worker processes. ###
+#
+# Usage: python3 -m bench.bench_update [FEEDS [ITEMS [JOBS...]]]
+#
+# FEEDS local feeds (default 200), with ITEMS articles each (default
+# 1000), are updated into an empty database once for each number of
+# processes in JOBS (default 1, 2, 4 and the number of CPU:s).
+
+# The database is placed in a temporary home, before it is looked up.
+home = prepare()
+from updater import *
+
+
+
+def main(feeds, items, counts):
+    corpus = write_corpus(os.path.join(home, 'corpus'), feeds, items = items, format = 'rss')
+    
+    baseline = None
+    for jobs in counts:
+        # Start from an empty database each time.
+        shutil.rmtree(root, ignore_errors = True)
+        os.makedirs(root)
+        tree = [{'id' : 'feed%i' % index, 'group' : None, 'new' : 0,
+                 'url' : 'file://%s' % corpus[index]} for index in range(feeds)]
+        start = time.perf_counter()
+        update_feeds_in_pool(tree, None, jobs)
+        elapsed = time.perf_counter() - start
+        if sum(feed['new'] for feed in tree) != feeds * items:
+            print('jobs %i: only %i of %i articles were stored' % (jobs, sum(feed['new'] for feed in tree), feeds * items))
+            return 1
+        baseline = elapsed if baseline is None else baseline
+        print('jobs %i: %.2f s, %.0f articles/s, speedup %.2f' % (jobs, elapsed, feeds * items / elapsed, baseline / elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        feeds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+        items = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+        counts = [int(jobs) for jobs in sys.argv[3:]]
+        counts = counts if len(counts) > 0 else sorted(set([1, 2, 4, os.cpu_count() or 1]))
+        sys.exit(main(feeds, items, counts))
+    finally:
+        shutil.rmtree(home, ignore_errors = True)
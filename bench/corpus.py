@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import random
+import time
+
+### Synthetic feed corpus. ###
+
+
+
+DATE_STYLES = { 'rfc822'         : ('rss',  '%a, %d %b %Y %H:%M:%S +0000'),
+                'rfc822-zone'    : ('rss',  '%a, %d %b %Y %H:%M:%S GMT'),
+                'rfc822-short'   : ('rss',  '%d %b %y %H:%M +0000'),
+                'rfc3339'        : ('atom', '%Y-%m-%dT%H:%M:%SZ'),
+                'rfc3339-offset' : ('atom', '%Y-%m-%dT%H:%M:%S+00:00'),
+                'rfc3339-frac'   : ('atom', '%Y-%m-%dT%H:%M:%S.000Z') }
+'''
+:dict<str, (str, str)>  Map from date styles, to the format they are used in and
+                        their `time.strftime` pattern, all in UTC
+'''
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+         'incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud').split(' ')
+'''
+:list<str>  Words to make titles and descriptions from
+'''
+
+EPOCH = 1400000000
+'''
+:int  The publication time, in POSIX time, of the latest article in each feed
+'''
+
+
+def escape(text):
+    '''
+    Escape text for XML
+    
+    @param   text:str  The text
+    @return  :str      The text, escaped
+    '''
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def words(rand, count):
+    '''
+    Make up some text
+    
+    @param   rand:Random  The random number generator
+    @param   count:int    The number of words
+    @return  :str         The text
+    '''
+    return ' '.join(rand.choice(WORDS) for _ in range(count))
+
+
+def generate_feed(format = 'rss', items = 100, description_length = 500, date_style = None,
+                  interval = 3600, seed = 0, name = 'feed'):
+    '''
+    Generate a feed document
+    
+    The articles are listed latest first, as almost all feeds do
+    
+    @param   format:str              'rss' or 'atom'
+    @param   items:int               The number of articles
+    @param   description_length:int  The approximate number of characters in each
+                                     description, which is HTML
+    @param   date_style:str?         The key in `DATE_STYLES` of how dates are written, 'rfc822'
+                                     or 'rfc3339', by format, if `None`, and '' for no dates
+    @param   interval:int            The number of seconds between the articles
+    @param   seed:int                The seed for the random text
+    @param   name:str                Used in the title, links and GUID:s
+    @return  :str                    The document
+    '''
+    if date_style is None:
+        date_style = 'rfc822' if format == 'rss' else 'rfc3339'
+    pattern = DATE_STYLES[date_style][1] if date_style else None
+    rand = random.Random(seed)
+    buf = ['<?xml version="1.0" encoding="utf-8"?>\n']
+    if format == 'rss':
+        buf.append('<rss version="2.0"><channel>\n')
+        buf.append('<title>%s</title><link>http://example.org/%s</link>\n' % (name, name))
+        buf.append('<description>%s</description>\n' % words(rand, 8))
+    else:
+        buf.append('<feed xmlns="http://www.w3.org/2005/Atom">\n')
+        buf.append('<title>%s</title><link href="http://example.org/%s"/>\n' % (name, name))
+        buf.append('<subtitle>%s</subtitle>\n' % words(rand, 8))
+    for item in range(items):
+        title = escape(words(rand, 6))
+        link = 'http://example.org/%s/%i' % (name, item)
+        guid = '%s-%i' % (name, items - item)
+        description = escape('<p>%s</p>' % words(rand, max(description_length // 6, 1)))
+        date = time.strftime(pattern, time.gmtime(EPOCH - item * interval)) if pattern else None
+        if format == 'rss':
+            buf.append('<item><title>%s</title><link>%s</link><guid>%s</guid>' % (title, link, guid))
+            if date is not None:
+                buf.append('<pubDate>%s</pubDate>' % date)
+            buf.append('<description>%s</description></item>\n' % description)
+        else:
+            buf.append('<entry><title>%s</title><link href="%s"/><id>%s</id>' % (title, link, guid))
+            if date is not None:
+                buf.append('<updated>%s</updated>' % date)
+            buf.append('<summary type="html">%s</summary></entry>\n' % description)
+    buf.append('</channel></rss>\n' if format == 'rss' else '</feed>\n')
+    return ''.join(buf)
+
+
+def write_corpus(directory, feeds, **options):
+    '''
+    Generate feed documents into files, alternating between RSS and Atom
+    unless the format is specified
+    
+    @param   directory:str    The directory to write the files in, it is created if missing
+    @param   feeds:int        The number of feeds
+    @param   options:**       Options for `generate_feed`, except `seed` and `name`
+    @return  :list<str>       The pathnames of the files
+    '''
+    os.makedirs(directory, exist_ok = True)
+    pathnames = []
+    for index in range(feeds):
+        format = options['format'] if 'format' in options else ('rss', 'atom')[index % 2]
+        kwargs = dict(options, format = format, seed = index, name = 'feed%i' % index)
+        pathname = os.path.join(directory, 'feed%i.xml' % index)
+        with open(pathname, 'wb') as file:
+            file.write(generate_feed(**kwargs).encode('utf-8'))
+        pathnames.append(pathname)
+    return pathnames
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import random
+import argparse
+
+from bench import prepare
+from bench.corpus import words, EPOCH
+
+### Synthetic feed database. ###
+#
+# Usage: python3 -m bench.database HOME [--groups N] [--feeds N] [--articles N]
+#                                       [--unread RATIO] [--coloured RATIO] [--seed N]
+#
+# Creates the database in HOME/.var/lib/featherweight, try it with
+# `HOME=HOME featherweight`. HOME must not already have a database.
+
+
+
+def generate_database(groups = 10, feeds = 10, articles = 1000, unread = 0.1, coloured = 0.05,
+                      description_length = 500, interval = 6 * 3600, seed = 0):
+    '''
+    Create a feed database, in `root`
+    
+    `prepare` must have been called, with the home directory of the database,
+    and the program's modules must not have been imported before that
+    
+    @param  groups:int              The number of groups in the feed tree
+    @param  feeds:int               The number of feeds in each group
+    @param  articles:int            The number of articles in each feed
+    @param  unread:float            The fraction of the articles that are unread
+    @param  coloured:float          The fraction of the articles, and of the feeds, that are coloured
+    @param  description_length:int  The approximate number of characters in each description
+    @param  interval:int            The number of seconds between the articles of a feed
+    @param  seed:int                The seed for the random text and state
+    '''
+    from common import root, save_file
+    from dates import split_time
+    from journal import Journal
+    from trees import FeedIndex
+    rand = random.Random(seed)
+    os.makedirs(root, exist_ok = True)
+    
+    tree = []
+    for group in range(groups):
+        branch = {'id' : 'group%i' % group, 'title' : 'Group %i' % group, 'group' : 'group%i' % group,
+                  'url' : None, 'new' : 0, 'inner' : []}
+        for index in range(feeds):
+            id = 'group%i-feed%i' % (group, index)
+            leaf = {'id' : id, 'title' : words(rand, 3).capitalize(), 'group' : branch['group'],
+                    'url' : 'http://example.org/%s.xml' % id, 'new' : 0}
+            if rand.random() < coloured:
+                leaf['colour'] = rand.randrange(1, 8)
+            
+            # Articles, latest first, as they are stored.
+            content = []
+            have, unread_guids = set(), set()
+            for article in range(articles):
+                seconds = EPOCH - article * interval - rand.randrange(interval)
+                entry = { 'title'       : words(rand, 6).capitalize(),
+                          'link'        : 'http://example.org/%s/%i' % (id, article),
+                          'guid'        : '%s-%i' % (id, articles - article),
+                          'description' : '<p>%s</p>' % words(rand, max(description_length // 6, 1)),
+                          'pubdate'     : split_time(seconds),
+                          'timestamp'   : seconds }
+                if rand.random() < coloured:
+                    entry['colour'] = rand.randrange(1, 8)
+                have.add(entry['guid'])
+                if rand.random() < unread:
+                    unread_guids.add(entry['guid'])
+                content.append(entry)
+            leaf['new'] = len(unread_guids)
+            branch['new'] += leaf['new']
+            branch['inner'].append(leaf)
+            
+            save_file('%s/%s' % (root, id), repr({'have' : have, 'unread' : unread_guids,
+                                                  'url' : leaf['url']}).encode('utf-8'), False)
+            save_file('%s/%s-content' % (root, id), repr(content).encode('utf-8'), False)
+        tree.append(branch)
+    
+    journal = Journal('%s/feeds' % root)
+    journal.index = FeedIndex(tree)
+    journal.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog = 'python3 -m bench.database')
+    parser.add_argument('home', help = 'home directory to create the database in')
+    parser.add_argument('--groups', type = int, default = 10, help = 'number of groups')
+    parser.add_argument('--feeds', type = int, default = 10, help = 'number of feeds per group')
+    parser.add_argument('--articles', type = int, default = 1000, help = 'number of articles per feed')
+    parser.add_argument('--unread', type = float, default = 0.1, help = 'fraction of articles that are unread')
+    parser.add_argument('--coloured', type = float, default = 0.05, help = 'fraction of articles and feeds that are coloured')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed for the random text and state')
+    options = parser.parse_args()
+    
+    home = os.path.abspath(options.home)
+    if os.path.exists(os.path.join(home, '.var', 'lib', 'featherweight', 'feeds')):
+        print('%s already has a feed database' % home, file = sys.stderr)
+        return 1
+    prepare(home)
+    generate_database(options.groups, options.feeds, options.articles, options.unread,
+                      options.coloured, seed = options.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+
+from bench import prepare
+from bench.corpus import write_corpus
+
+### Benchmark suite, writes its results as JSON. ###
+#
+# Usage: python3 -m bench.suite [--output FILE] [--feeds N] [--items N]
+#                               [--description-length N] [--date-style STYLE]
+#                               [--rounds N] [--only NAME...]
+#
+# Results, by benchmark: the durations of each round, in seconds, their
+# minimum and median, and the number of items processed per round.
+
+
+
+def measure(function, rounds, setup = None):
+    '''
+    Time a function
+    
+    @param   function:()→void  The function
+    @param   rounds:int        The number of times to call the function
+    @param   setup:()→void?    Function to call, untimed, before each call
+    @return  :list<float>      The duration of each call, in seconds
+    '''
+    durations = []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def bench_parse_feed(context):
+    '''
+    Parse every feed document in memory
+    
+    @param   context:dict<str, _>  The corpus, and the parameters of the run
+    @return  :(list<float>, int)   The durations of the rounds, and the number of items per round
+    '''
+    from parser import parse_feed
+    documents = []
+    for pathname in context['corpus']:
+        with open(pathname, 'rb') as file:
+            documents.append(file.read())
+    def run():
+        for document in documents:
+            parse_feed(document)
+    return (measure(run, context['rounds']), len(documents) * context['items'])
+
+
+def bench_update_feed(context):
+    '''
+    Fetch every feed, from `file://` URL:s, into an empty database
+    
+    @param   context:dict<str, _>  The corpus, and the parameters of the run
+    @return  :(list<float>, int)   The durations of the rounds, and the number of items per round
+    '''
+    from common import root
+    from updater import update_feed
+    tree = [{'id' : 'feed%i' % index, 'group' : None, 'new' : 0, 'url' : 'file://%s' % pathname}
+            for (index, pathname) in enumerate(context['corpus'])]
+    def setup():
+        shutil.rmtree(root, ignore_errors = True)
+        os.makedirs(root)
+    def run():
+        for feed in tree:
+            update_feed(feed, None)
+    return (measure(run, context['rounds'], setup), len(tree) * context['items'])
+
+
+def bench_update_feed_unchanged(context):
+    '''
+    Fetch every feed again, when nothing is new
+    
+    @param   context:dict<str, _>  The corpus, and the parameters of the run
+    @return  :(list<float>, int)   The durations of the rounds, and the number of items per round
+    '''
+    from updater import update_feed
+    tree = [{'id' : 'feed%i' % index, 'group' : None, 'new' : 0, 'url' : 'file://%s' % pathname}
+            for (index, pathname) in enumerate(context['corpus'])]
+    def run():
+        for feed in tree:
+            update_feed(feed, None)
+    run()
+    return (measure(run, context['rounds']), len(tree) * context['items'])
+
+
+def bench_load_feed(context):
+    '''
+    Load every feed from the database, as when it is opened
+    
+    @param   context:dict<str, _>  The corpus, and the parameters of the run
+    @return  :(list<float>, int)   The durations of the rounds, and the number of items per round
+    '''
+    from feeds import load_feed
+    ids = ['feed%i' % index for index in range(len(context['corpus']))]
+    def run():
+        for id in ids:
+            load_feed(id)
+    return (measure(run, context['rounds']), len(ids) * context['items'])
+
+
+def bench_print_tree(context):
+    '''
+    Render the articles of every feed, with all dates expanded, into a frame
+    
+    @param   context:dict<str, _>  The corpus, and the parameters of the run
+    @return  :(list<float>, int)   The durations of the rounds, and the number of items per round
+    '''
+    from trees import Tree
+    from feeds import load_feed
+    Tree.terminal_size = staticmethod(lambda : (context['rows'], context['columns']))
+    trees = []
+    for index in range(len(context['corpus'])):
+        tree = Tree('feed%i' % index, load_feed('feed%i' % index)[0])
+        # Expand everything, so each print has the same, full, amount of work.
+        stack = list(tree.feeds)
+        while len(stack) > 0:
+            node = stack.pop()
+            if 'inner' in node:
+                node['expanded'] = True
+                stack.extend(tree.children(node))
+        trees.append(tree)
+    stdout = sys.stdout
+    def run():
+        with open(os.devnull, 'w') as sys.stdout:
+            for tree in trees:
+                tree.draw_force = True
+                tree.print_tree()
+    try:
+        return (measure(run, context['rounds']), len(trees))
+    finally:
+        sys.stdout = stdout
+
+
+BENCHMARKS = [('parse_feed',           bench_parse_feed),
+              ('update_feed',          bench_update_feed),
+              ('update_feed_unchanged', bench_update_feed_unchanged),
+              ('load_feed',            bench_load_feed),
+              ('print_tree',           bench_print_tree)]
+'''
+:list<(str, (dict<str, _>)→(list<float>, int))>  The benchmarks, in the order they must
+                                                  be run, later benchmarks use the database
+                                                  created by earlier ones
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(prog = 'python3 -m bench.suite')
+    parser.add_argument('--output', default = 'bench-results.json', help = 'file to write the results to')
+    parser.add_argument('--feeds', type = int, default = 20, help = 'number of feeds')
+    parser.add_argument('--items', type = int, default = 500, help = 'number of articles per feed')
+    parser.add_argument('--description-length', type = int, default = 500, help = 'characters per description')
+    parser.add_argument('--date-style', default = None, help = 'how dates are written, see bench/corpus.py')
+    parser.add_argument('--format', default = None, choices = ['rss', 'atom'], help = 'only use one format')
+    parser.add_argument('--rounds', type = int, default = 5, help = 'times to run each benchmark')
+    parser.add_argument('--rows', type = int, default = 50, help = 'terminal height for print_tree')
+    parser.add_argument('--columns', type = int, default = 160, help = 'terminal width for print_tree')
+    parser.add_argument('--only', nargs = '*', default = None, help = 'benchmarks to run')
+    options = parser.parse_args()
+    
+    home = prepare()
+    try:
+        corpus_options = {'items' : options.items, 'description_length' : options.description_length}
+        if options.date_style is not None:
+            corpus_options['date_style'] = options.date_style
+        if options.format is not None:
+            corpus_options['format'] = options.format
+        context = { 'corpus'  : write_corpus(os.path.join(home, 'corpus'), options.feeds, **corpus_options),
+                    'items'   : options.items,
+                    'rounds'  : options.rounds,
+                    'rows'    : options.rows,
+                    'columns' : options.columns }
+        
+        results = {}
+        for (name, benchmark) in BENCHMARKS:
+            # Benchmarks that are not selected are still run once, if later ones need the database.
+            selected = (options.only is None) or (name in options.only)
+            if not selected:
+                if name == 'update_feed':
+                    benchmark(dict(context, rounds = 1))
+                continue
+            (durations, count) = benchmark(context)
+            ordered = sorted(durations)
+            results[name] = { 'durations' : durations,
+                              'min'       : ordered[0],
+                              'median'    : ordered[len(ordered) // 2],
+                              'count'     : count }
+            print('%-22s min %8.4f s  median %8.4f s  %10.0f/s' %
+                  (name, ordered[0], ordered[len(ordered) // 2], count / ordered[len(ordered) // 2]))
+        
+        report = { 'time'       : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                   'python'     : platform.python_version(),
+                   'platform'   : platform.platform(),
+                   'parameters' : dict((key, value) for (key, value) in vars(options).items()
+                                       if key not in ('output', 'only')),
+                   'results'    : results }
+        with open(options.output, 'w') as file:
+            json.dump(report, file, indent = 2, sort_keys = True)
+            file.write('\n')
+    finally:
+        shutil.rmtree(home, ignore_errors = True)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 import os
 import sys
+import copy
 import uuid
 from subprocess import Popen, PIPE
 
@@ -29,7 +30,10 @@ from common import _
 from flocker import *
 from trees import *
 from updater import *
+from journal import *
 from feeds import *
+from writer import *
+from profiler import *
 
 ### Prologue and feed tree page. ###
 
@@ -62,117 +66,128 @@ repair = '--repair' in args
 '''
 
 
+def option_value(option, bare = None):
+    '''
+    Get the value of an option that is given as `--option VALUE` or `--option=VALUE`
+    
+    @param   option:str  The option, with the dashes
+    @param   bare:str?   If not `None`, the value is optional, it can only be given as
+                         `--option=VALUE`, and this is the value if it is omitted
+    @return  :str?       The value of its last occurrence, `None` if it is not used
+    '''
+    value = None
+    for (i, arg) in enumerate(args):
+        if arg.startswith(option + '='):
+            value = arg[len(option) + 1:]
+        elif (arg == option) and (bare is not None):
+            value = bare
+        elif (arg == option) and (i + 1 < len(args)):
+            value = args[i + 1]
+    return value
+
+
+record = option_value('--record')
+'''
+:str?  Directory to save the fetched files in, with `--update`
+'''
+
+replay = option_value('--replay')
+'''
+:str?  Directory of files saved with `--record` to fetch from, rather than the network, with `--update`
+'''
+
+jobs = option_value('--jobs', '0')
+if (jobs is not None) and not jobs.isdecimal():
+    print('%s: %s' % (sys.argv[0], _('--jobs must be given as --jobs or --jobs=N, where N is 0 or more')),
+          file = sys.stderr)
+    sys.exit(2)
+jobs = 1 if jobs is None else int(jobs)
+'''
+:int  The number of processes to fetch and parse feeds in, with `--update`, 0 for one per CPU
+'''
+
+profile = ([None] + [True if arg == '--profile' else arg[len('--profile='):]
+                     for arg in args if (arg == '--profile') or arg.startswith('--profile=')])[-1]
+'''
+:bool|str?  Time the phases of the run? `True` to print the summary, a string for the file to
+            write it to, and to write a cProfile dump to that file with '.pstats' appended
+'''
+
+
+# Time everything from here, the summary is written when we exit.
+if profile is not None:
+    profiler.start(None if profile is True else profile)
+
+
+# Fetch files from, or save them to, a directory, with --update.
+if replay is not None:
+    replay_fetches(replay)
+elif record is not None:
+    record_fetches(record)
+
+
 # Ensure the existance of the directory for data files.
 if not os.path.exists(root):
     os.makedirs(root)
 
 
 
-def flatten(feeds, rc = None):
-    '''
-    Return all list of all nodes
-    
-    @param   feeds:itr<dict<str, _|↑>>  List of trees
-    @param   rc:list<dict<str, _|↑>>?   List to populate and return; for method internal use
-    @return  :list<dict<str, _|↑>>      List of all nodes
-    '''
-    if rc is None:
-        rc = []
-        flatten(feeds, rc)
-        return rc
-    else:
-        for feed in feeds:
-            rc.append(feed)
-            if 'inner' in feed:
-                flatten(feed['inner'], rc)
-
-
-def save_feeds_and_status(feeds, status):
-    '''
-    Save feed list file and new-article-count file
-    
-    @param  feeds:itr<dict<str, _|↑>>  The feeds
-    @param  status:int                 The number of unread articles
-    '''
-    # Format data to store in files.
-    feeds = repr(feeds).encode('utf-8')
-    status = ('%i\n' % status).encode('utf-8')
-    # Update the feed list file.
-    with open('%s/feeds' % root, 'wb') as file:
-        file.write(feeds)
-    # Create a backup of it too.
-    with open('%s/feeds.bak' % root, 'wb') as file:
-        file.write(feeds)
-    # Update file with new-article count.
-    # This must be done only whilst the feed-list file is locked.
-    with open('%s/status' % root, 'wb') as file:
-        file.write(status)
-
-
 # Load feeds, and possiblity do more with it.
-feeds = None
-with touch('%s/feeds' % root) as feeds_flock:
-    # Read file, with a lock on it as short as possible.
-    flock(feeds_flock, False, _('Feed database is locked by another process, waiting...'))
-    with open('%s/feeds' % root, 'rb') as file:
-        feeds = file.read()
-    unflock(feeds_flock)
-    # Decode and parse file.
-    feeds = feeds.decode('utf-8', 'strict')
-    feeds = [] if len(feeds) == 0 else eval(feeds)
+journal = Journal('%s/feeds' % root)
+with touch('%s/feeds.lock' % root) as feeds_flock:
+    # Read file, without a lock, files are replaced rather than
+    # modified, so we always see the last complete version.
+    journal.load()
+    feeds = journal.index.feeds
     # --update, --repair, --status
     if update or repair or status:
         # Get affected group.
         group = None
-        for arg in args:
+        for (i, arg) in enumerate(args):
+            # Skip the values of options.
+            if (i > 0) and (args[i - 1] in ('--record', '--replay')):
+                continue
             if not arg.startswith('-'):
                 group = arg
                 break
         ### --update (fetch new articles) ###
         if update:
-            # Create map from ID to new-article count.
-            old_counts = dict((feed['id'], feed['new']) for feed in flatten(feeds))
-            # Fetch new articles.
-            for feed in feeds:
-                update_feed(feed, group)
-            # Lock the feed-list file for writing.
-            flock(feeds_flock, True, _('Feed database is locked by another process, waiting...'))
-            # Create list of ID–new-article count-pairs, with new counts.
-            new = [(feed['id'], feed['new']) for feed in flatten(feeds)]
-            # Re-read feed list file to avoid race conditions with other processes.
-            with open('%s/feeds' % root, 'rb') as file:
-                feeds = file.read()
-            feeds = feeds.decode('utf-8', 'strict')
-            feeds = [] if len(feeds) == 0 else eval(feeds)
+            # Fetch new articles, into a copy of the feed list, which is updated through the journal.
+            fetched = copy.deepcopy(feeds)
+            update_feeds_in_pool(fetched, group, jobs)
             # Increase new-article counts with how much we increased it would.
-            # (Remember than another process may have updated it too.)
-            flat_feeds = dict((feed['id'], feed) for feed in flatten(feeds))
-            for id, new_value in new:
-                if id in flat_feeds.keys():
-                    flat_feeds[id]['new'] += new_value - old_counts[id]
-            # Save updates.
-            save_feeds_and_status(feeds, Tree.count_new(feeds))
+            # (Remember than another process may have updated it too, the
+            # journal applies such changes before ours.) Only leaves are
+            # updated by `update_feed`, the branches get the difference
+            # from their descendants.
+            old_counts = dict((id, feed['new']) for (id, feed) in journal.index.nodes.items())
+            records = [('newness', id, feed['new'] - old_counts[id])
+                       for (id, feed) in FeedIndex(fetched).nodes.items()
+                       if (id in old_counts) and not (feed['new'] == old_counts[id])]
+            # Lock the feed-list file for writing, and save updates.
+            flock(feeds_flock, True, _('Feed database is locked by another process, waiting...'))
+            journal.append(records)
+            feeds = journal.index.feeds
             # We are done, unlock the file.
             unflock(feeds_flock)
         ### --repair (repair damages) ###
         if repair:
             # Lock the feed-list file for writing.
             flock(feeds_flock, True, _('Feed database is locked by another process, waiting...'))
+            # Apply changes made by other processes.
+            journal.replay()
+            feeds = journal.index.feeds
             # Recount new articles and repair feeds.
-            new_status = 0
-            for feed in flatten(feeds):
+            for feed in journal.index.nodes.values():
                 pathname = '%s/%s' % (root, feed['id'])
                 # File does not exist? That just means that its too new.
                 if not os.access(pathname, os.F_OK):
                     continue
-                # Open feed channel file for reading.
-                with open(pathname, 'rb') as file:
-                    # Lock the feed file for reading, and read.
-                    flock(file, False, _('The feed is locked by another process, waiting...'))
-                    feed_info = file.read()
-                    # Back up the file.
-                    with open('%s.bak' % pathname, 'wb') as bakfile:
-                        bakfile.write(feed_info)
+                # Open feed channel file's lock.
+                with touch('%s.lock' % pathname) as file:
+                    # Lock the feed file for writing, and read.
+                    flock(file, True, _('The feed is locked by another process, waiting...'))
+                    feed_info = read_file(pathname)
                     # Decode and parse feed file.
                     feed_info = feed_info.decode('utf-8', 'strict')
                     feed_info = eval(feed_info) if len(feed_info) > 0 else {}
@@ -185,22 +200,21 @@ with touch('%s/feeds' % root) as feeds_flock:
                     for unread_entry in list(unread):
                         if unread_entry not in have:
                             del unread[unread_entry]
-                    # Store correct new-article count, and increment grand total.
+                    # Store correct new-article count.
                     feed['new'] = len(unread)
-                    new_status += len(unread)
                     # Save repaired feed file.
                     try:
-                        feed_info = repr(feed_info).encode('utf-8')
-                        with open(pathname, 'wb') as mewfile:
-                            mewfile.write(feed_info)
+                        save_file(pathname, repr(feed_info).encode('utf-8'))
                         unflock(file)
                     except Exception as err:
                         unflock(file)
+                        # The file is saved by renaming a new file over it, so it is left as it was.
                         pathname = abbr(root) + pathname[len(root):]
-                        print('\033[01;31m%s\033[00m', _('Your %s was saved to %s.bak') % (pathname, pathname))
+                        print('\033[01;31m%s\033[00m' % (_('Your %s could not be saved: %s') % (pathname, str(err))))
                         raise err
-            # Save changes.
-            save_feeds_and_status(feeds, new_status)
+            # Save changes, with the new-article counts of all branches recounted.
+            Tree.count_new(feeds)
+            journal.save()
             # We are done, unlock the file.
             unflock(feeds_flock)
         ### --status (report new-article count) ###
@@ -218,16 +232,13 @@ with touch('%s/feeds' % root) as feeds_flock:
                             count += feed['new']
                     return count
                 print(get_status(feeds, False))
-            # Otherwise, use status file.
-            elif not os.access('%s/status' % root, os.F_OK):
-                # New-article count is zero if it does not exist.
-                print('0')
+            # Otherwise, use status file, it is replaced rather
+            # than modified, so no lock is needed.
             else:
-                flock(feeds_flock, False)
-                with open('%s/status' % root, 'rb') as file:
-                    sys.stdout.buffer.write(file.read())
+                count = read_file('%s/status' % root)
+                # New-article count is zero if it does not exist.
+                sys.stdout.buffer.write(b'0\n' if count is None else count)
                 sys.stdout.buffer.flush()
-                unflock(feeds_flock)
 
 
 # We are done, if no interactive session is wanted.
@@ -245,41 +256,38 @@ print('\033[?1049h\033[?25l\033[?9h', end = '', flush = True)
 
 
 
-def update_feeds(function):
+def update_feeds(record):
     '''
-    Make changes to the feeds and save them asynchronously (and a separate process)
+    Make a change to the feeds and save it asynchronously (in the background)
     
-    @param  function:(feeds:itr<dict<str, _|↑>>)→void  Function that modifies the feeds
+    @param  record:(str, *_)  The change, see `apply_record`
     '''
-    # Make changes.
-    function(feeds)
-    # Update new article counts.
-    Tree.count_new(feeds)
+    # Make changes, to a copy of the record, so the record does
+    # not share any values with the tree until it has been saved.
+    apply_record(feeds_index, copy.deepcopy(record))
     # Save changes.
-    pathname = '%s/feeds' % root
-    with touch(pathname) as feeds_flock:
-        pid = flock_fork(feeds_flock)
-        if pid == 0:
-            return
-        feeds_ = make_backup(pathname, False).decode('utf-8', 'strict')
-        feeds_ = [] if len(feeds_) == 0 else eval(feeds_)
-        function(feeds_)
-        if save_file_or_die(pathname, pid is None, lambda : repr(feeds_).encode('utf-8')):
+    def job(records):
+        with touch('%s/feeds.lock' % root) as feeds_flock:
+            flock(feeds_flock, True)
             try:
-                status = Tree.count_new(feeds_)
-                with open('%s/status' % root, 'wb') as file:
-                    file.write(('%i\n' % status).encode('utf-8'))
-            except:
-                pass
-        unflock_fork(feeds_flock, pid)
+                journal.append(records)
+            finally:
+                unflock(feeds_flock)
+    writer.submit(journal.journal, job, record)
 
 
 # Interactive session.
 try:
-    # Create tree of feed list.
+    # Create tree of feed list, and an index of it. The journal has its own
+    # copy, which is updated in the background, when changes are saved.
+    feeds = copy.deepcopy(feeds)
+    feeds_index = FeedIndex(feeds)
     tree = Tree('My Feeds', feeds)
     # Session.
     while True:
+        # Stop if changes could not be saved, the user is told when the terminal is restored.
+        if len(writer.failures) > 0:
+            break
         # Get input command from user.
         (action, node) = tree.interact()
         # Exit.
@@ -320,7 +328,7 @@ try:
             # Any changes?
             if saved:
                 # Apply them.
-                update_feeds(lambda t : update_node(t, None if node is None else node['id'], values))
+                update_feeds(('update', None if node is None else node['id'], values))
             # Redraw the screen, now that there is not editor open anymore.
             print('\033[H\033[2J', end = '', flush = True)
             tree.draw_force = True
@@ -333,7 +341,7 @@ try:
             # until we get back here) if they affect the feed list file.
             def update(new):
                 tree.count += new
-                update_feeds(lambda t : update_node_newness(t, node['id'], new))
+                update_feeds(('newness', node['id'], new))
             # Open the page for the feed.
             if open_feed(node, update):
                 # This means that the user selected to quit rather than return.
@@ -370,7 +378,7 @@ try:
             # Did the user go through with it?
             if saved:
                 # Add the node.
-                update_feeds(lambda t : insert_node(t, None if node is None else node['id'], values))
+                update_feeds(('insert', None if node is None else node['id'], values))
             # Redraw the screen, now that there is not editor open anymore.
             print('\033[H\033[2J', end = '', flush = True)
             tree.draw_force = True
@@ -383,14 +391,13 @@ try:
             Popen(['stty', 'echo', 'icanon'], stdout = PIPE, stderr = PIPE).communicate()
             print('\033[H\033[2J\033[?25h\033[?9l%s' % (_('Are you sure you to delete %s?') % double_quote(node['title'])))
             print(_('Type %s, if you are sure.') % quote(_('yes')))
-            delete = sys.stdin.readline().replace('\n', '') == _('yes')
+            delete = read_line() == _('yes')
             Popen(['stty', '-echo', '-icanon'], stdout = PIPE, stderr = PIPE).communicate()
             print('\033[?25l\033[?9h', end = '', flush = True)
             # Did the user really want this?
             if delete:
                 # Delete the node.
-                node = node['id']
-                update_feeds(lambda t : remove_node(t, node))
+                update_feeds(('remove', node['id']))
                 tree.select_stack.pop()
             # Redraw the screen, now that there is no dialogue on it.
             print('\033[H\033[2J', end = '', flush = True)
@@ -402,7 +409,6 @@ try:
                 continue
             # Get parent node.
             parent = tree.select_stack[-2][0]
-            id_p = None if parent is None else parent['id']
             parent = feeds if parent is None else parent['inner']
             # Get the position of the selected node and its adjacent.
             nodei = tree.select_stack[-1][1]
@@ -411,31 +417,8 @@ try:
                 # Cannot move up if at beginning, or down if at end.
                 continue
             id_i, id_j = parent[nodei]['id'], parent[nodej]['id']
-            # We will have to redraw the swapped lines.
-            parent[nodei]['draw_line'] = -1
-            parent[nodej]['draw_line'] = -1
-            # Function for moving the node.
-            def save(t, id_t = None):
-                # We need to search, because another process may have modified the tree.
-                # Visiting the parent?
-                if id_p == id_t:
-                    # Find positions of the selected node and its adjacent.
-                    i_is = [i for i in range(len(t)) if t[i]['id'] == id_i]
-                    j_is = [i for i in range(len(t)) if t[i]['id'] == id_j]
-                    if (i_is == [nodei]) and (j_is == [nodej]):
-                        # Swap their positions.
-                        t[nodei], t[nodej] = t[nodej], t[nodei]
-                    return True
-                # Visit children.
-                else:
-                    for child in t:
-                        if 'inner' in child:
-                            if save(child['inner'], child['id']):
-                                return True
-                # No luck. Search next child.
-                return False
             # Apply changes.
-            update_feeds(save)
+            update_feeds(('swap', id_i, id_j))
             # Update selection stack.
             tree.select_stack[-1] = (parent[nodej], nodej)
         # Move outward (that is left.)
@@ -446,36 +429,11 @@ try:
                 continue
             # Whither?
             parent = tree.select_stack[-2][0]
-            id_p = parent['id'],
+            id_p = parent['id']
             # Whence?
             id_n = node['id']
-            # Function for moving the node.
-            def save(t, id_t = None, t_i = None, p = None):
-                # We need to search, because another process may have modified the tree.
-                # Visiting the parent?
-                if id_p == id_t:
-                    # Find position of selected node.
-                    n_is = [i for i in range(len(t)) if t[i]['id'] == id_n]
-                    if len(n_is) == 1:
-                        n_i = n_is[0]
-                        # Move the node.
-                        p.insert(t_i, t[n_i])
-                        del t[n_i]
-                        # Mark the parent as a leaf if it is empty.
-                        if len(t) == 0:
-                            del p[t_i + 1]['inner']
-                    return True
-                # Visit children.
-                else:
-                    for i in range(len(t)):
-                        child = t[i]
-                        if 'inner' in child:
-                            if save(child['inner'], child['id'], i, t):
-                                return True
-                # No luck. Search next child.
-                return False
             # Apply changes.
-            update_feeds(save)
+            update_feeds(('out', id_n, id_p))
             # Update selection stack.
             tree.select_stack.pop()
             tree.select_stack[-1] = (node, tree.select_stack[-1][1])
@@ -488,7 +446,6 @@ try:
                 continue
             # Get parent node.
             parent = tree.select_stack[-2][0]
-            id_p = None if parent is None else parent['id']
             parent = feeds if parent is None else parent['inner']
             # Get selected node.
             nodei = tree.select_stack[-1][1]
@@ -498,45 +455,14 @@ try:
                 continue
             # Get the node beneath the select node, its parent-to-be.
             id_m = parent[nodei + 1]['id']
-            # Function for moving the node.
-            def save(t, id_t = None):
-                # We need to search, because another process may have modified the tree.
-                # Visiting the parent?
-                if id_p == id_t:
-                    # Find position of the select node, and the node beneath it.
-                    n_is = [i for i in range(len(t)) if t[i]['id'] == id_n]
-                    m_is = [i for i in range(len(t)) if t[i]['id'] == id_m]
-                    if (len(n_is) != 1) or (m_is != [n_is[0] + 1]):
-                        return True
-                    n_i = n_is[0]
-                    # Get new parent.
-                    new_parent = t[m_is[0]]
-                    if new_parent['url'] is not None:
-                        return True
-                    # Reparent.
-                    if 'inner' not in new_parent:
-                        new_parent['inner'] = []
-                    new_parent['inner'].insert(0, t[n_i])
-                    del t[n_i]
-                    return True
-                # Visit children.
-                else:
-                    for i in range(len(t)):
-                        child = t[i]
-                        if 'inner' in child:
-                            if save(child['inner'], child['id']):
-                                return True
-                # No luck. Search next child.
-                return False
             # Apply changes.
-            update_feeds(save)
+            update_feeds(('in', id_n, id_m))
             # Update selection stack.
             tree.select_stack.pop()
             tree.select_stack.append((parent[nodei], nodei))
             tree.select_stack.append((parent[nodei]['inner'][0], 0))
             # Force redraw.
             tree.draw_force = True
-            node['draw_line'] = -1
         # Mark as read or not.
         elif action in ('read', 'unread'):
             # We do not have entires, just feeds, nothing to read/unread.
@@ -551,8 +477,7 @@ try:
             if node is None:
                 continue
             action = ... if action == '0' else (int(action) % 8)
-            update_feeds(lambda t : update_node(t, node['id'], {'colour' : action}))
-            node['draw_line'] = -1
+            update_feeds(('update', node['id'], {'colour' : action}))
 
 # Error?
 except Exception as err:
@@ -563,4 +488,11 @@ finally:
     if not terminated:
         Popen(['stty', old_stty], stdout = PIPE, stderr = PIPE).communicate()
         print('\n\033[?9l\033[?25h\033[?1049l', end = '', flush = True)
+    # Let the changes be saved before exiting, and tell the user about those that were not.
+    writer.wait()
+    for (filename, err) in writer.report():
+        # Files are saved by renaming a new file over them, so a
+        # file that could not be saved is left as it was.
+        filename = abbr(root) + filename[len(root):]
+        print('\033[01;31m%s\033[00m' % (_('Your %s could not be saved: %s') % (filename, str(err))))
 
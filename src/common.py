@@ -17,8 +17,12 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 import os
+import sys
 import pwd
 import gettext
+import shutil
+import threading
+import calendar
 from subprocess import Popen, PIPE
 
 ### Useful things. ###
@@ -89,73 +93,144 @@ old_stty = None
 :str  `stty`-stored terminal configurations
 '''
 
+backups = os.environ['FEATHERWEIGHT_BACKUPS'] if 'FEATHERWEIGHT_BACKUPS' in os.environ else ''
+backups = int(backups) if backups.isdigit() else 1
+'''
+:int  The number of old versions of each file to keep as backups
+'''
+
+sync = os.environ['FEATHERWEIGHT_FSYNC'] if 'FEATHERWEIGHT_FSYNC' in os.environ else ''
+sync = sync not in ('', '0')
+'''
+:bool  Should saved files be synchronised to the disk before they replace the old versions?
+'''
 
-def make_backup(filename, if_exists = True):
+
+def timestamp(pubdate):
     '''
-    Backup a file and return its content
+    Get the POSIX time of the publication of an article
     
-    @param   filename:str    The path of the file
-    @param   if_exists:bool  Do nothing if the file does not exist?
-    @return  :bytes?         The content of the file
+    @param   pubdate:list<int>  The publication time, in UTC: year, month,
+                                day, hour, minute and second, in that order
+    @return  :int               The publication time in seconds since the Epoch
     '''
-    backup = None
-    if (not if_exists) or os.access(filename, os.F_OK):
-        with open(filename, 'rb') as file:
-            backup = file.read()
-            with open(filename + '.bak', 'wb') as bakfile:
-                bakfile.write(backup)
-    return backup
+    return calendar.timegm(tuple(pubdate[:6]))
 
 
-def save_file(filename, backup, datafun):
+def sort_content(content):
     '''
-    Save data to a file, but retry to restore it on failure
+    Ensure that the articles of a feed are ordered with the latest first,
+    and have their publication time in POSIX time stored in 'timestamp'
+    
+    Content files written by `--update` are already in order, making
+    this a linear check, unless they were written by an older version
     
-    @param  filename:str    The path of the file
-    @param  backup:bytes?   The old content of the file
-    @param  datafun:()→str  Nullary functional that evaluates to the new content
+    @param   content:list<dict<str, _>>  The articles, will be updated in place
+    @return  :bool                       Whether the articles had to be updated
     '''
-    # Store new data.
+    updated, ordered, last = False, True, None
+    for entry in content:
+        if 'timestamp' not in entry:
+            entry['timestamp'] = timestamp(entry['pubdate'])
+            updated = True
+        if (last is not None) and (entry['timestamp'] > last):
+            ordered = False
+        last = entry['timestamp']
+    if not ordered:
+        content.sort(key = lambda entry : -(entry['timestamp']))
+    return updated or not ordered
+
+
+def read_line():
+    '''
+    Read a line from the terminal
+    
+    The terminal is read one byte at a time, without a buffer, so input
+    typed after the line is left for the feed tree, or whatever reads next
+    
+    @return  :str  The line, without the line feed
+    '''
+    line = b''
+    while True:
+        byte = os.read(sys.stdin.fileno(), 1)
+        if byte in (b'\n', b''):
+            return line.decode('utf-8', 'replace')
+        line += byte
+
+
+def read_file(filename):
+    '''
+    Read a file, if it exists
+    
+    @param   filename:str  The path of the file
+    @return  :bytes?       The content of the file, `None` if it does not exist
+    '''
+    if not os.access(filename, os.F_OK):
+        return None
+    with open(filename, 'rb') as file:
+        return file.read()
+
+
+def rotate_backups(filename):
+    '''
+    Keep the current version of a file as its latest backup,
+    and shift older backups one generation
+    
+    The backup is a hard link, so the file's content is not copied
+    
+    @param  filename:str  The path of the file
+    '''
+    if (backups == 0) or not os.access(filename, os.F_OK):
+        return
+    # Generation 1 is `filename + '.bak'`, generation n > 1 is `filename + '.bak.n'`.
+    name = lambda n : '%s.bak' % filename if n == 1 else '%s.bak.%i' % (filename, n)
+    for n in reversed(range(1, backups)):
+        if os.access(name(n), os.F_OK):
+            os.rename(name(n), name(n + 1))
     try:
-        data = datafun()
-        with open(filename, 'wb') as file:
-            file.write(data)
-    except Exception as err:
-	# Try to restore old file on error.
-        try:
-            if backup is not None:
-                with open(filename, 'wb') as file:
-                    file.write(backup)
-        except:
-            pass
-        raise err
+        if os.access(name(1), os.F_OK):
+            os.unlink(name(1))
+        os.link(filename, name(1))
+    except OSError:
+        # The file system does not support hard links.
+        shutil.copyfile(filename, name(1))
 
 
-def save_file_or_die(filename, raise_error, datafun):
+def save_file(filename, data, backup = True):
     '''
-    Save data to a file, die verbosely on failure
+    Save data to a file atomically
     
-    The error message assumes that there is a backup
-    at `filename + '.bak'`
+    The data is written to a temporary file, which is renamed to the file,
+    so a crash cannot leave a partially written file. The file must be
+    locked, with a lock file, not the file itself, since it is replaced
     
-    @param   filename:str      The path of the file
-    @param   raise_error:bool  Should an error be raised on error?
-    @param   datafun:()→str    Nullary functional that evaluates to the new content
-    @return  :bool             Successful?
+    @param  filename:str  The path of the file
+    @param  data:bytes    The new content of the file
+    @param  backup:bool   Keep the old version as a backup?
     '''
-    global terminated, old_stty, root
+    # Different threads may save the same file, the rendered-article cache for example.
+    tempname = '%s.tmp.%i.%i' % (filename, os.getpid(), threading.get_ident())
     try:
-        data = datafun()
-        with open(filename, 'wb') as file:
+        with open(tempname, 'wb') as file:
             file.write(data)
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+        if backup:
+            rotate_backups(filename)
+        os.rename(tempname, filename)
     except Exception as err:
-        Popen(['stty', old_stty], stdout = PIPE, stderr = PIPE).communicate()
-        print('\n\033[?9l\033[?25h\033[?1049l' if pid is None else '\n', end = '', flush = True)
-        filename = abbr(root) + filename[len(root):]
-        print('\033[01;31m%s\033[00m', _('Your %s was saved to %s.bak') % (filename, filename))
-        terminated = True
-        if raise_error:
-            raise err
-        return False
-    return True
+        # Do not leave the temporary file behind.
+        try:
+            os.unlink(tempname)
+        except:
+            pass
+        raise err
+    # Make the rename durable too.
+    if sync:
+        dirfd = os.open(os.path.dirname(filename) or '.', os.O_RDONLY)
+        try:
+            os.fsync(dirfd)
+        finally:
+            os.close(dirfd)
 
@@ -0,0 +1,187 @@
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import re
+import time
+
+### Parsing of publication dates in news feeds. ###
+
+
+
+MONTHS = { 'jan' : 1, 'feb' : 2, 'mar' : 3, 'apr' : 4, 'may' : 5, 'jun' : 6,
+           'jul' : 7, 'aug' : 8, 'sep' : 9, 'oct' : 10, 'nov' : 11, 'dec' : 12 }
+'''
+:dict<str, int>  Map from the first three letters of the names of the months, in lower case, to their numbers
+'''
+
+ZONES = { 'ut' : 0, 'utc' : 0, 'gmt' : 0, 'z' : 0,
+          'est' : -5 * 3600, 'edt' : -4 * 3600, 'cst' : -6 * 3600, 'cdt' : -5 * 3600,
+          'mst' : -7 * 3600, 'mdt' : -6 * 3600, 'pst' : -8 * 3600, 'pdt' : -7 * 3600 }
+'''
+:dict<str, int>  Map from time zones, in lower case, to their offsets from UTC in seconds,
+                 numerical offsets are added when they are first seen
+'''
+
+ATOM_DATE = re.compile(r'\s*(\d{4})-(\d\d)-(\d\d)(?:[Tt ](\d\d):(\d\d)(?::(\d\d)(?:[.,]\d*)?)?)?\s*([Zz]|[+-]\d\d:?\d\d)?\s*$')
+'''
+:regex  RFC 3339 dates, as used in Atom, the time and the time zone may be missing
+'''
+
+CACHE_SIZE = 1 << 12
+'''
+:int  The maximum number of dates to remember the values of, per format
+'''
+
+cache = {'rss' : {}, 'atom' : {}}
+'''
+:dict<str, dict<str, int?>>  Map from formats, to map from dates to their values
+'''
+
+
+def epoch(year, month, day, hour, minute, second):
+    '''
+    Convert a time in UTC to POSIX time
+    
+    The month and day may be out of range, they carry over to the year and month
+    
+    @param   year:int    The year
+    @param   month:int   The month, 1 for January
+    @param   day:int     The day of the month, 1 for the first day
+    @param   hour:int    The hour
+    @param   minute:int  The minute
+    @param   second:int  The second
+    @return  :int        The time in seconds since the Epoch
+    '''
+    # Count from March, so the leap day is at the end of the year.
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    if month <= 2:
+        year -= 1
+        month += 12
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month - 3) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+    return ((days * 24 + hour) * 60 + minute) * 60 + second
+
+
+def zone_offset(zone):
+    '''
+    Get the offset of a time zone from UTC
+    
+    @param   zone:str  The time zone, its name or its numerical offset, such as `+0100` or `+01:00`
+    @return  :int?     The offset, in seconds, `None` if not recognised
+    '''
+    zone = zone.lower()
+    if zone in ZONES:
+        return ZONES[zone]
+    offset = None
+    digits = zone[1:].replace(':', '')
+    if (zone[:1] in ('+', '-')) and (len(digits) == 4) and digits.isdigit():
+        offset = int(digits[:2]) * 3600 + int(digits[2:]) * 60
+        offset = -offset if zone[0] == '-' else offset
+        ZONES[zone] = offset
+    return offset
+
+
+def remember(format, value, seconds):
+    '''
+    Remember the value of a date
+    
+    @param   format:str     The format of the date
+    @param   value:str      The date
+    @param   seconds:int?   The value of the date
+    @return  :int?          `seconds`
+    '''
+    entries = cache[format]
+    if len(entries) >= CACHE_SIZE:
+        entries.clear()
+    entries[value] = seconds
+    return seconds
+
+
+def rss_date(value):
+    '''
+    Parse an RFC 822 date, as used in RSS, such as `Mon, 06 Sep 2010 16:45:00 +0000`
+    
+    The day of the week, and the seconds, are optional, the year may have two
+    digits, and the time zone may be a name or a numerical offset
+    
+    @param   value:str  The date
+    @return  :int?      The date in seconds since the Epoch, `None` if it cannot be parsed
+    '''
+    if value in cache['rss']:
+        return cache['rss'][value]
+    tokens = value.replace(',', ' ').split()
+    # Skip the day of the week.
+    if (len(tokens) > 0) and tokens[0][:1].isalpha():
+        tokens = tokens[1:]
+    if not (4 <= len(tokens) <= 5):
+        return remember('rss', value, None)
+    (day, month, year, clock) = tokens[:4]
+    zone = tokens[4] if len(tokens) == 5 else 'gmt'
+    month = month[:3].lower()
+    clock = clock.split(':')
+    offset = zone_offset(zone)
+    if (month not in MONTHS) or (offset is None) or not (2 <= len(clock) <= 3):
+        return remember('rss', value, None)
+    try:
+        (day, year) = (int(day), int(year))
+        (hour, minute) = (int(clock[0]), int(clock[1]))
+        second = int(clock[2]) if len(clock) == 3 else 0
+    except ValueError:
+        return remember('rss', value, None)
+    # Two-digit years, as in RFC 822, rather than RFC 1123.
+    if year < 100:
+        year += 2000 if year < 50 else 1900
+    seconds = epoch(year, MONTHS[month], day, hour, minute, second) - offset
+    return remember('rss', value, seconds)
+
+
+def atom_date(value):
+    '''
+    Parse an RFC 3339 date, as used in Atom, such as `2010-09-06T16:45:00Z`
+    
+    Fractions of seconds are ignored, and a missing time zone is taken as UTC
+    
+    @param   value:str  The date
+    @return  :int?      The date in seconds since the Epoch, `None` if it cannot be parsed
+    '''
+    if value in cache['atom']:
+        return cache['atom'][value]
+    match = ATOM_DATE.match(value)
+    if match is None:
+        return remember('atom', value, None)
+    (year, month, day, hour, minute, second, zone) = match.groups()
+    offset = 0 if zone is None else zone_offset(zone)
+    if offset is None:
+        return remember('atom', value, None)
+    fields = [int(field) if field is not None else 0 for field in (year, month, day, hour, minute, second)]
+    seconds = epoch(*fields) - offset
+    return remember('atom', value, seconds)
+
+
+def split_time(seconds):
+    '''
+    Convert POSIX time to a time in UTC
+    
+    @param   seconds:int  The time in seconds since the Epoch
+    @return  :list<int>   The year, month, day, hour, minute and second, in that order
+    '''
+    return list(time.gmtime(seconds)[:6])
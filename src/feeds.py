@@ -18,6 +18,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 import os
 import sys
+import time
 from subprocess import Popen, PIPE
 
 from pytagomacs.editor import *
@@ -26,11 +27,19 @@ from common import *
 from common import _
 from flocker import *
 from trees import *
+from store import *
+from renderer import *
+from profiler import *
 
 ### Feed page. ###
 
 
 
+FLUSH_INTERVAL = 10
+'''
+:float  Number of seconds read/unread changes may be queued before they are written
+'''
+
 MONTHS = { 1 : 'January',
            2 : 'February',
            3 : 'March',
@@ -55,103 +64,138 @@ def load_feed(id):
     '''
     Load the feeds
     
+    Only the year-branches are created, the months in a year, the days
+    in a month, and the articles in a day, are created when they are
+    first needed (see `Tree.children`), from a summary of the new-article
+    count and colours of each date that is made when the feed is loaded.
+    
     @param   id:str                                    The ID of the feed
     @return  :(entries:itr<dict<str, int|str|↑>>,      Feed entries
                years:dict<str|int, int|str|↑|itr<↑>>,  Mapping for dates to branches in `entries`,
                                                        `years[2014][11][25]['inner']` lists all feeds entries
-                                                       for 2014-(11)Nov-25.
+                                                       for 2014-(11)Nov-25, once they have been created.
                have:set<str>,                          A set of all ID:s of the leaves in `entries`
                unread:set<str>)                        A set of all ID:s of the read leaves in `entries`
     '''
-    next_id = 0
     entries = []
     years = {}
     have, unread = set(), set()
-    with touch('%s/%s' % (root, id)) as feed_flock:
+    with touch('%s/%s.lock' % (root, id)) as feed_flock:
         # Read files.
         flock(feed_flock, False, _('The feed is locked by another process, waiting...'))
-        feed_info, feed_data = None, None
-        if os.access('%s/%s' % (root, id), os.F_OK):
-            with open('%s/%s' % (root, id), 'rb') as file:
-                feed_info = file.read()
-            if os.access('%s/%s-content' % (root, id), os.F_OK):
-                with open('%s/%s-content' % (root, id), 'rb') as file:
-                    feed_data = file.read()
-            unflock(feed_flock)
+        with profiler.phase('metadata load'):
+            feed_info = read_file('%s/%s' % (root, id))
+            # Decode and parse metadata file.
+            feed_info = b'' if feed_info is None else feed_info
+            feed_info = feed_info.decode('utf-8', 'strict')
+            feed_info = eval(feed_info) if len(feed_info) > 0 else {}
+        content = read_content(id)
+        unflock(feed_flock)
+    have   = set() if 'have'   not in feed_info else feed_info['have']
+    unread = set() if 'unread' not in feed_info else feed_info['unread']
+    building = time.perf_counter()
+    
+    # The content is ordered by publication time, newest first, by `read_content`.
+    
+    # Group articles by date, in a single pass since they are in order.
+    # `dates` lists (year, months)-pairs, where `months` lists (month, days)-
+    # pairs, where `days` lists (day, articles)-pairs, all latest first.
+    # Also count new articles and colours for each year, month and day,
+    # `summaries[(2014, 11)]` is the summary for 2014-(11)Nov.
+    dates = []
+    summaries = {}
+    for entry in content:
+        (year, month, day) = entry['pubdate'][:3]
+        if (len(dates) == 0) or not (dates[-1][0] == year):
+            dates.append((year, []))
+        months = dates[-1][1]
+        if (len(months) == 0) or not (months[-1][0] == month):
+            months.append((month, []))
+        days = months[-1][1]
+        if (len(days) == 0) or not (days[-1][0] == day):
+            days.append((day, []))
+        days[-1][1].append(entry)
+        new = 1 if entry['guid'] in unread else 0
+        colour = entry['colour'] if 'colour' in entry else ...
+        for date in ((year,), (year, month), (year, month, day)):
+            if date not in summaries:
+                summaries[date] = {'new' : 0, 'colours' : dict((c, 0) for c in [...] + list(range(8)))}
+            summaries[date]['new'] += new
+            summaries[date]['colours'][colour] += 1
+    
+    def branch(parent, date, title, materialise):
+        '''
+        Create a year-, month- or day-branch, without its children
         
-        # Decode and parse metadata file.
-        feed_info = feed_info.decode('utf-8', 'strict')
-        feed_info = eval(feed_info) if len(feed_info) > 0 else {}
-        have   = set() if 'have'   not in feed_info else feed_info['have']
-        unread = set() if 'unread' not in feed_info else feed_info['unread']
+        @param   parent:dict<int, dict<str, _>>  The mapping, in `years` or an branch, to add the branch to
+        @param   date:(int, int?, int?)          The year, month and day of the branch, as long as required
+        @param   title:str                       The title of the branch
+        @param   materialise:()→list<dict<str, _>>  Function that creates the children of the branch
+        @return  :dict<str, _>                   The branch
+        '''
+        summary = summaries[date]
+        node = {'id' : date, 'title' : title, 'new' : summary['new'], 'colours' : summary['colours']}
+        node.update(zip(('year', 'month', 'day'), date))
+        colour = colour_mode(summary['colours'])
+        if not colour == ...:
+            node['colour'] = colour
+        node['inner'] = None
+        node['materialise'] = materialise
+        parent[date[-1]] = node
+        return node
+    
+    def materialise_year(year, months):
+        '''
+        Create the month-branches for a year
+        
+        @param   year:int                         The year
+        @param   months:list<(int, list<(int, list<dict<str, _>>)>)>  The months in the year, latest first
+        @return  :list<dict<str, _>>              The month-branches
+        '''
+        node = years[year]
+        return [branch(node, (year, month), MONTHS[month] if month in MONTHS else str(month),
+                       lambda month = month, days = days : materialise_month(year, month, days))
+                for (month, days) in months]
+    
+    def materialise_month(year, month, days):
+        '''
+        Create the day-branches for a month
+        
+        @param   year:int                         The year
+        @param   month:int                        The month
+        @param   days:list<(int, list<dict<str, _>>)>  The days in the month, latest first
+        @return  :list<dict<str, _>>              The day-branches
+        '''
+        node = years[year][month]
+        title = MONTHS[month][:3] if month in MONTHS else ''
+        return [branch(node, (year, month, day), '%03i-(%02i)%s-%02i' % (year, month, title, day),
+                       lambda articles = articles : materialise_day(articles))
+                for (day, articles) in days]
+    
+    def materialise_day(articles):
+        '''
+        Create the article-leaves for a day
         
-        # Construct tree.
-        if feed_data is not None:
-            feed_data = eval(feed_data.decode('utf-8', 'strict'))
-            for entry in feed_data:
-                entry['id'] = entry['guid']
-                # Set new-article-count on the article itself.
-                entry['new'] = 1 if entry['guid'] in unread else 0
-                # Get publication/retrieval time.
-                pubdate = entry['pubdate']
-                entry['time'] = (pubdate[3] * 60 + pubdate[4]) * 100 + pubdate[5]
-                # Get title.
-                entry['realtitle'] = entry['title']
-                title = entry['title'].split('\n')[0]
-                entry['title'] = '(%02i:%02i:%02i) %s' % (pubdate[3], pubdate[4], pubdate[5], title)
-                # Year branch.
-                if pubdate[0] not in years:
-                    year_entry = {}
-                    years[pubdate[0]] = year_entry
-                    entries.append(year_entry)
-                    year_entry['year'] = pubdate[0]
-                    year_entry['title'] = _('Year %i') % pubdate[0]
-                    year_entry['inner'] = []
-                    year_entry['id'] = next_id
-                    next_id += 1
-                # Month branch.
-                months = years[pubdate[0]]
-                if pubdate[1] not in months:
-                    month_entry = {}
-                    months[pubdate[1]] = month_entry
-                    months['inner'].append(month_entry)
-                    month_entry['year'] = pubdate[0]
-                    month_entry['month'] = pubdate[1]
-                    month_entry['title'] = MONTHS[pubdate[1]] if pubdate[1] in MONTHS else str(pubdate[1])
-                    month_entry['inner'] = []
-                    month_entry['id'] = next_id
-                    next_id += 1
-                # Day branch.
-                days = months[pubdate[1]]
-                if pubdate[2] not in days:
-                    day_entry = {}
-                    days[pubdate[2]] = day_entry
-                    days['inner'].append(day_entry)
-                    day_entry['year'] = pubdate[0]
-                    day_entry['month'] = pubdate[1]
-                    day_entry['day'] = pubdate[2]
-                    title =  MONTHS[pubdate[1]][:3] if pubdate[1] in MONTHS else ''
-                    title = '%03i-(%02i)%s-%02i' % (pubdate[0], pubdate[1], title, pubdate[2])
-                    day_entry['title'] = title
-                    day_entry['inner'] = []
-                    day_entry['id'] = next_id
-                    next_id += 1
-                # Add article to day branch.
-                days[pubdate[2]]['inner'].append(entry)
-                # Colour nodes.
-                ancestors = [year_entry, month_entry, day_entry]
-                colour = entry['colour'] if 'colour' in entry else ...
-                colour_propagation(ancestors, colour, None)
+        @param   articles:list<dict<str, _>>  The articles published that day, latest first
+        @return  :list<dict<str, _>>          The article-leaves
+        '''
+        for entry in articles:
+            entry['id'] = entry['guid']
+            # Set new-article-count on the article itself.
+            entry['new'] = 1 if entry['guid'] in unread else 0
+            # Get title.
+            pubdate = entry['pubdate']
+            entry['realtitle'] = entry['title']
+            title = entry['title'].split('\n')[0]
+            entry['title'] = '(%02i:%02i:%02i) %s' % (pubdate[3], pubdate[4], pubdate[5], title)
+        return articles
     
-    # Sort the tree.
-    entries.sort(key = lambda x : -(x['year']))
-    for year in entries:
-        year['inner'].sort(key = lambda x : -(x['month']))
-        for month in year['inner']:
-            month['inner'].sort(key = lambda x : -(x['day']))
-            for day in month['inner']:
-                day['inner'].sort(key = lambda x : -(x['time']))
+    # Create the year-branches.
+    for (year, months) in dates:
+        entries.append(branch(years, (year,), _('Year %i') % year,
+                              lambda year = year, months = months : materialise_year(year, months)))
     
+    profiler.record('tree build', time.perf_counter() - building)
     return (entries, years, have, unread)
 
 
@@ -166,17 +210,20 @@ def update_entries(feed_id, function):
     '''
     updated = False
     pathname = '%s/%s' % (root, feed_id)
-    with touch(pathname) as feed_flock:
+    with touch('%s.lock' % pathname) as feed_flock:
         flock(feed_flock, True)
-        feed_info = make_backup(pathname)
+        with profiler.phase('metadata load'):
+            feed_info = read_file(pathname)
+            if feed_info is not None:
+                feed_info = feed_info.decode('utf-8', 'strict')
+                feed_info = eval(feed_info) if len(feed_info) > 0 else {}
         if feed_info is not None:
-            feed_info = feed_info.decode('utf-8', 'strict')
-            feed_info = eval(feed_info) if len(feed_info) > 0 else {}
             have   = set() if 'have'   not in feed_info else feed_info['have']
             unread = set() if 'unread' not in feed_info else feed_info['unread']
             updated_ = len(have) + len(unread)
             function(have, unread)
-            save_file_or_die(pathname, True, lambda : repr(feed_info).encode('utf-8'))
+            with profiler.phase('metadata save'):
+                save_file(pathname, repr(feed_info).encode('utf-8'))
             if not updated_ == len(have) + len(unread):
                 updated = True
         unflock(feed_flock)
@@ -184,25 +231,78 @@ def update_entries(feed_id, function):
 
 
 
-def update_content_file(feed_id, function):
+def queue_read_state(feed_id, mod, guids):
     '''
-    Apply changes to a news feed content file
+    Queue marking of entries in a feed as either read or unread
     
-    @param  feed_in:str                              The ID of the feed
-    @param  function:(itr<dict<str, int|str>>)→void  Function that modifies the content
+    The change is appended to the feed's pending-file, which is cheap
+    and survives crashes, and applied by `flush_read_state`
+    
+    @param  feed_id:str     The ID of the feed
+    @param  mod:`-1`|`+1`   -1 to mark as read, +1 to mark as unread
+    @param  guids:itr<str>  The GUID:s of the entries
     '''
-    pathname = '%s/%s-content' % (root, feed_id)
-    with touch(pathname) as feed_flock:
-        pid = flock_fork(feed_flock)
-        if pid == 0:
-            return
-        feed_content = make_backup(pathname)
-        if feed_content is not None:
-            feed_content = feed_content.decode('utf-8', 'strict')
-            feed_content = eval(feed_content) if len(feed_content) > 0 else []
-            function(feed_content)
-            save_file_or_die(pathname, pid is None, lambda : repr(feed_content).encode('utf-8'))
-        unflock_fork(feed_flock, pid)
+    with touch('%s/%s-pending.lock' % (root, feed_id)) as pending_flock:
+        flock(pending_flock, True)
+        with open('%s/%s-pending' % (root, feed_id), 'a') as pending_file:
+            # Write the entire record at once, and start it on a new line, so that a
+            # record torn by a crash cannot corrupt the records written after it.
+            pending_file.write('\n%s' % repr((mod, list(guids))))
+            pending_file.flush()
+        unflock(pending_flock)
+
+
+
+def flush_read_state(feed_id):
+    '''
+    Apply the queued read/unread changes for a feed, in one batch
+    
+    The changes are sets of GUID:s, so applying them again, after a crash
+    or over a concurrent update of the feed, gives the same result
+    
+    @param   feed_id:str  The ID of the feed
+    @return  :int         How much the number of unread entries changed
+    '''
+    delta = 0
+    applied = None
+    pathname = '%s/%s-pending' % (root, feed_id)
+    if not os.access(pathname, os.F_OK):
+        return 0
+    def fun(have, unread):
+        nonlocal delta, applied
+        with touch('%s.lock' % pathname) as pending_flock:
+            flock(pending_flock, True)
+            applied = read_file(pathname)
+            unflock(pending_flock)
+        records = [] if applied is None else applied.decode('utf-8', 'strict').split('\n')
+        count = len(unread)
+        for record in records:
+            # Skip the empty line at the beginning, and a record torn by a crash.
+            try:
+                (mod, guids) = eval(record)
+            except:
+                continue
+            if mod == 1:
+                [unread.add(guid) for guid in guids if guid in have]
+            elif mod == -1:
+                [unread.discard(guid) for guid in guids]
+        delta = len(unread) - count
+    update_entries(feed_id, fun)
+    # Remove the applied changes from the queue, now that `update_entries` has saved
+    # them, if we crash before this, they are applied again, which does no harm.
+    if applied is not None:
+        with touch('%s.lock' % pathname) as pending_flock:
+            flock(pending_flock, True)
+            records = read_file(pathname)
+            if records is not None:
+                # Keep the changes that were queued while we applied the others.
+                records = records[len(applied):] if records.startswith(applied) else records
+                if len(records) == 0:
+                    os.unlink(pathname)
+                else:
+                    save_file(pathname, records, False)
+            unflock(pending_flock)
+    return delta
 
 
 
@@ -213,13 +313,7 @@ def delete_entry_content(feed_id, guids):
     @param  feed_in:str     The ID of the feed
     @param  guids:set<str>  The GUID:s of the messages to delete
     '''
-    def fun(feed_content):
-        i = len(feed_content)
-        while i > 0:
-            i -= 1
-            if feed_content[i]['guid'] in guids:
-                del feed_content[i]
-    update_content_file(feed_id, fun)
+    log_records(feed_id, [('delete', list(guids))])
 
 
 
@@ -232,16 +326,7 @@ def modify_entry(feed_id, updates):
                                                               to mapping for keys to new values, `...` as a
                                                               value means that the key should be deleted
     '''
-    def fun(feed_content):
-        for content in feed_content:
-            if content['guid'] in updates:
-                values = updates[content['guid']]
-                for key in values.keys():
-                    if values[key] == ...:
-                        del content[key]
-                    else:
-                        content[key] = values[key]
-    update_content_file(feed_id, fun)
+    log_records(feed_id, [('edit', guid, values) for (guid, values) in updates.items()])
 
 
 
@@ -255,8 +340,14 @@ def open_feed(feed_node, callback):
     @return  :bool                       Whether the entire program should exit
     '''
     id = feed_node['id']
+    # Apply changes left queued by a session that crashed.
+    delta = flush_read_state(id)
+    if not delta == 0:
+        callback(delta)
     (entries, years, have, unread) = load_feed(id)
     tree = Tree(feed_node['title'], entries)
+    # Monotonic time of the oldest read/unread change that has not been written.
+    queued = None
     
     def get_nodes(node, qualifier):
         '''
@@ -276,7 +367,7 @@ def open_feed(feed_node, callback):
         # At root or branch?
         else:
             # Visit children.
-            inners = node['inner'] if node is not None else entries
+            inners = tree.children(node) if node is not None else entries
             for inner in inners:
                 nodes += get_nodes(inner, qualifier)
         return nodes
@@ -288,26 +379,30 @@ def open_feed(feed_node, callback):
         @param  mod:`-1`|`+1`              -1 to mark as read, +1 to mark as unread
         @param  nodes:itr<dict<str, _|↑>>  Nodes to mark as read or unread
         '''
+        nonlocal queued
         # Get GUID:s of articles to update.
         guids = [node['guid'] for node in nodes]
-        # Calls a given for all nodes that qualifies.
-        def update(f, qualifer):
-            [f(guid) for guid in guids if qualifer(guid)]
         # Mark as unread?
         if mod == 1:
-            # Update tree.
-            updated = update_entries(id, lambda _, unread : update(unread.add, lambda g : g not in unread))
+            guids = [guid for guid in guids if guid not in unread]
             # Update 'unread'-set.
-            [unread.add(guid) for guid in guids if guid not in unread]
+            [unread.add(guid) for guid in guids]
         # Mark as read?
         elif mod == -1:
-            # Update tree.
-            updated = update_entries(id, lambda _, unread : update(unread.remove, lambda g : g in unread))
+            guids = [guid for guid in guids if guid in unread]
             # Update 'unread'-set.
-            [unread.remove(guid) for guid in guids if guid in unread]
+            [unread.remove(guid) for guid in guids]
         else:
             # Never reached.
             return
+        if len(guids) == 0:
+            return
+        changed = set(guids)
+        nodes = [node for node in nodes if node['guid'] in changed]
+        # Queue the change for the feed's file, it is written later.
+        queue_read_state(id, mod, guids)
+        if queued is None:
+            queued = time.monotonic()
         # Update new-article-counter for thee feed (root).
         tree.count += mod * len(guids)
         # Update nodes.
@@ -318,14 +413,27 @@ def open_feed(feed_node, callback):
             while len(ancestors) < 3:
                 ancestors.append(ancestors[-1][pubdate[len(ancestors)]])
             ancestors.append(node) # ... and the nodes themself.
-            # Things will have to be redrawn.
+            # Update new-artice-counter for all ancestors.
             for node in ancestors:
-                node['new'] += mod # Update new-artice-counter for all ancestors.
-                node['draw_line'] = -1
-            tree.redraw_root = True
-        # Save changes to the feed tree, and feed list file.
-        if updated:
-            callback(mod * len(guids))
+                node['new'] += mod
+        # Do not let the queue grow old while the user is busy.
+        if time.monotonic() - queued >= FLUSH_INTERVAL:
+            flush()
+    
+    def flush():
+        '''
+        Write queued read/unread changes to the feed's file, and
+        save the changes to the feed tree, and feed list file
+        '''
+        nonlocal queued
+        if queued is not None:
+            queued = None
+            delta = flush_read_state(id)
+            if not delta == 0:
+                callback(delta)
+    
+    # Write queued changes when the user is idle.
+    tree.idle = (FLUSH_INTERVAL, flush)
     
     # Session.
     while True:
@@ -333,9 +441,11 @@ def open_feed(feed_node, callback):
         (action, node) = tree.interact()
         # Exit.
         if action == 'quit':
+            flush()
             return True
         # Back to the first page.
         elif action == 'back':
+            flush()
             return False
         # Edit article.
         elif action == 'edit':
@@ -376,19 +486,12 @@ def open_feed(feed_node, callback):
             if (node is None) or ('inner' in node):
                 # We can only read articles, not the root or year-, month- or date-branches.
                 continue
-            # Get link and description (content) of article.
-            description = ''
-            if 'link' in node:
-                description += '%s<br><br>' % (_('Link: %s') % node['link'])
-            if 'description' in node:
-                description += node['description']
-            description = description.encode('utf-8')
-            # Convert from HTML to pony-readable format.
-            proc = ['html2text'] ## Well that (markdown (in new versions)) isn't really readable, but we will soon do something about that.
-            if ('FEATHERWEIGHT_HTML' in os.environ) and (not os.environ['FEATHERWEIGHT_HTML'] == ''):
-                proc = ['sh', '-c', os.environ['FEATHERWEIGHT_HTML']]
-            proc = Popen(proc, stdin = PIPE, stdout = PIPE, stderr = sys.stderr)
-            description = proc.communicate(description)[0]
+            # Get link and description (content) of article, in pony-readable format.
+            width = Tree.terminal_size()[1]
+            description = render_article(node, width)
+            # Render the articles the user is likely to read next, whilst this one is read.
+            if prefetch_depth > 0:
+                prefetcher.prefetch(tree.upcoming_unread(prefetch_depth), width)
             # Get pager.
             pager = os.environ['PAGER'] if 'PAGER' in os.environ else None
             pager = None if pager == '' else pager
@@ -418,8 +521,8 @@ def open_feed(feed_node, callback):
                 print('\033[H\033[2J\033[?9l', end = '', flush = True)
                 sys.stdout.buffer.write(description)
                 sys.stdout.buffer.flush()
-                while sys.stdin.read(1)[0] != '\n':
-                    pass
+                # Wait until the user presses return.
+                read_line()
                 print('\033[?9h\033[H\033[2J', end = '', flush = True)
             # Redraw the screen, now that there is not an article on it anymore.
             tree.draw_force = True
@@ -440,7 +543,7 @@ def open_feed(feed_node, callback):
             Popen(['stty', 'echo', 'icanon'], stdout = PIPE, stderr = PIPE).communicate()
             print('\033[H\033[2J\033[?25h\033[?9l%s' % (_('Are you sure you to delete %s?') % double_quote(node['title'])))
             print(_('Type %s, if you are sure.') % quote(_('yes')))
-            delete = sys.stdin.readline().replace('\n', '') == _('yes')
+            delete = read_line() == _('yes')
             Popen(['stty', '-echo', '-icanon'], stdout = PIPE, stderr = PIPE).communicate()
             print('\033[?25l\033[?9h', end = '', flush = True)
             print('\033[H\033[2J', end = '', flush = True)
@@ -463,8 +566,9 @@ def open_feed(feed_node, callback):
                         del nodes[i]
                         tree.select_stack.pop()
                         return True
-                    # Is this a branch?
-                    elif 'inner' in nodes[i]:
+                    # Is this a branch? (Branches whose children have not been
+                    # created cannot contain the node, it has been created.)
+                    elif ('inner' in nodes[i]) and ('materialise' not in nodes[i]):
                         # Visit children.
                         if delete_node(nodes[i]['inner'], node_id):
                             # Found it.
@@ -502,15 +606,30 @@ def open_feed(feed_node, callback):
                 del node['colour']
             else:
                 node['colour'] = action
-            # Request redraw of node.
-            node['draw_line'] = -1
             # List ancestors.
             pubdate = node['pubdate']
             ancestors = [years[pubdate[0]]]
             while len(ancestors) < 3:
                 ancestors.append(ancestors[-1][pubdate[len(ancestors)]])
             # Propagate colour ancestors, as appropriate.
-            colour_propagation(ancestors, colour, old_colour)
+            colour_propagation(ancestors, action, old_colour)
+
+
+def colour_mode(colours):
+    '''
+    Get the colour of a branch from the colours of the articles inside it
+    
+    @param   colours:dict<...|int, int>  Mapping from colours to the number of articles
+                                         inside the branch with that colour, `...`
+                                         for no colour
+    @return  :...|int                    The most common colour, `...` if none is coloured
+    '''
+    mode_c, mode_f = ..., 0
+    for c in range(8):
+        if mode_f < colours[c]:
+            mode_f = colours[c]
+            mode_c = c
+    return mode_c
 
 
 def colour_propagation(ancestors, colour, old_colour):
@@ -519,32 +638,15 @@ def colour_propagation(ancestors, colour, old_colour):
     
     @param  ancestors:list<dict<str, _|int>>  List of ancestors, in left-to-right order
     @param  colour:...|int                    The new colour, `...` for uncolouring
-    @param  old_colour:...|int?               The old colour, `...' for no colour,
-                                              `None` if not known yet
+    @param  old_colour:...|int                The old colour, `...' for no colour
     '''
-    if (old_colour is not None) or (not colour == ...):
-        for ancestor in reversed(ancestors):
-            if 'colours' not in ancestor:
-                ancestor['colours'] = dict((c, 0) for c in list(range(8)))
-                ancestor['colours'][...] = len(ancestor['inner']) - (1 if old_colour is None else 0)
-            old_ancestor_colour = ancestor['colour'] if 'colour' in ancestor else ...
-            if old_colour is not None:
-                ancestor['colours'][old_colour] -= 1
-            ancestor['colours'][colour] += 1
-            mode_c, mode_f = ..., 0
-            for c in range(8):
-                if mode_f < ancestor['colours'][c]:
-                    mode_f = ancestor['colours'][c]
-                    mode_c = c
-            if not old_ancestor_colour == mode_c:
-                if mode_c == ...:
-                    del ancestor['colour']
-                else:
-                    ancestor['colour'] = mode_c
-            if old_colour is not None:
-		ancestor['draw_line'] = -
-    else:
-        for ancestor in ancestors:
-            if 'colours' in ancestor:
-                ancestor['colours'][...] += 1
-
+    for ancestor in reversed(ancestors):
+        old_ancestor_colour = ancestor['colour'] if 'colour' in ancestor else ...
+        ancestor['colours'][old_colour] -= 1
+        ancestor['colours'][colour] += 1
+        mode_c = colour_mode(ancestor['colours'])
+        if not old_ancestor_colour == mode_c:
+            if mode_c == ...:
+                del ancestor['colour']
+            else:
+                ancestor['colour'] = mode_c
@@ -20,6 +20,8 @@ import os
 import sys
 import fcntl
 
+from profiler import *
+
 ### File locking, so we can have multiple processes running. ###
 
 
@@ -47,7 +49,11 @@ def flock(file, exclusive, nonblocking = False):
     '''
     if isinstance(nonblocking, bool):
         locktype = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (fcntl.LOCK_NB if nonblocking else 0)
-        fcntl.flock(file.fileno(), locktype)
+        if nonblocking:
+            fcntl.flock(file.fileno(), locktype)
+        else:
+            with profiler.phase('lock wait'):
+                fcntl.flock(file.fileno(), locktype)
     else:
         try:
             flock(file, exclusive, True)
@@ -64,39 +70,3 @@ def unflock(file):
     '''
     fcntl.flock(file.fileno(), fcntl.LOCK_UN)
 
-
-def flock_fork(file):
-    '''
-    Attempt to apply an exlusive file lock on a file,
-    if it is blocking, fork the process and wait
-    until it does not block anymore
-    
-    Stop what you are doing if zero is returned
-    
-    @param   file:file  The file handle
-    @return  :int?      `None` if there as no fork, otherwise the rules of `os.fork`
-    '''
-    pid = None
-    try:
-        flock(file, True, True)
-    except:
-        pid = os.fork()
-    if (pid is not None) and (not pid == 0):
-        flock(feed_flock, True)
-    return pid
-
-
-def unflock_fork(file, pid):
-    '''
-    Take appropriate actions when finished with the file lock,
-    this may exit the program
-    
-    Do not call if `flock_fork` returned zero
-    
-    @param  file:file  The file handle
-    @param  :int?      The return of `flock_fork`
-    '''
-    unflock(file)
-    if pid is not None:
-        sys.exit(0)
-
@@ -0,0 +1,165 @@
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+
+from common import *
+from trees import *
+
+### The feed list file, and its journal. ###
+
+
+
+CHECKPOINT_SIZE = 64 << 10
+'''
+:int  The size, in bytes, the journal may grow to before
+      its changes are written to the snapshot
+'''
+
+
+class Journal():
+    '''
+    A feed list, stored as a snapshot of the tree and a journal of the
+    changes made after the snapshot was written
+    
+    The first line of the snapshot is a comment with the number of its
+    checkpoint, and the first line of the journal is the number of the
+    checkpoint it continues from, the changes in the journal are ignored
+    if they do not match. The rest of the journal is records for
+    `apply_record`, one per line. A record is not complete until its line
+    is, so a record cut short by a crash is ignored
+    
+    The methods that write must be called with an exclusive lock on the feed
+    list. Reading does not need a lock: the snapshot is replaced rather than
+    modified, and the journal is only appended to between checkpoints, so a
+    reader sees the last complete version. If the journal belongs to a newer
+    checkpoint than the snapshot the reader read, it reads the new snapshot
+    
+    @variable  pathname:str      The pathname of the snapshot
+    @variable  journal:str       The pathname of the journal
+    @variable  index:FeedIndex   The feed list, with all changes in the journal applied
+    @variable  checkpoint:int    The number of the checkpoint of the snapshot
+    @variable  offset:int?       How much of the journal has been applied, `None` if
+                                 the journal is missing or does not match the snapshot
+    '''
+    
+    def __init__(self, pathname):
+        '''
+        Constructor, `load` must be called before the feed list is used
+        
+        @param  pathname:str  The pathname of the snapshot
+        '''
+        self.pathname = pathname
+        self.journal = '%s.journal' % pathname
+        self.index = None
+        self.checkpoint = 0
+        self.offset = None
+    
+    
+    def load(self):
+        '''
+        Read the snapshot and apply the journal
+        '''
+        feeds = read_file(self.pathname)
+        feeds = '' if feeds is None else feeds.decode('utf-8', 'strict')
+        # Snapshots written by older versions do not have a checkpoint number.
+        self.checkpoint = int(feeds[1 : feeds.find('\n')]) if feeds.startswith('#') else 0
+        self.index = FeedIndex([] if len(feeds) == 0 else eval(feeds))
+        self.offset = None
+        self.replay()
+    
+    
+    def replay(self):
+        '''
+        Apply changes that have been added to the journal, by any process,
+        since the journal was last read
+        '''
+        if not os.access(self.journal, os.F_OK):
+            self.offset = None
+            return
+        with open(self.journal, 'rb') as file:
+            header = file.readline()
+            # Has another process made a checkpoint?
+            if int(header) > self.checkpoint:
+                self.load()
+                return
+            # Is the journal from before the checkpoint of the snapshot?
+            if int(header) < self.checkpoint:
+                self.offset = None
+                return
+            if self.offset is None:
+                self.offset = len(header)
+            file.seek(self.offset)
+            records = file.read()
+        # Ignore an incomplete record at the end.
+        records = records[: records.rfind(b'\n') + 1]
+        self.offset += len(records)
+        for record in records.decode('utf-8', 'strict').split('\n')[:-1]:
+            apply_record(self.index, eval(record))
+    
+    
+    def append(self, records):
+        '''
+        Add changes to the journal, and apply them
+        
+        @param  records:itr<(str, *_)>  The changes, see `apply_record`
+        '''
+        self.replay()
+        # Start a new journal, if it is missing or from before the snapshot.
+        if self.offset is None:
+            header = ('%i\n' % self.checkpoint).encode('utf-8')
+            save_file(self.journal, header, False)
+            self.offset = len(header)
+        data = ''.join('%s\n' % repr(record) for record in records).encode('utf-8')
+        with open(self.journal, 'r+b') as file:
+            # Remove a record cut short by a crash.
+            file.truncate(self.offset)
+            file.seek(self.offset)
+            file.write(data)
+            file.flush()
+            if sync:
+                os.fsync(file.fileno())
+        # Apply the records, as read back from the journal, so
+        # they do not share any values with the caller.
+        self.replay()
+        if self.offset >= CHECKPOINT_SIZE:
+            self.save()
+        else:
+            self.save_status()
+    
+    
+    def save(self):
+        '''
+        Make a checkpoint: write the feed list to a new snapshot, and empty the journal
+        '''
+        self.checkpoint += 1
+        feeds = '#%i\n%s' % (self.checkpoint, repr(self.index.feeds))
+        save_file(self.pathname, feeds.encode('utf-8'))
+        # If we crash here, the journal will be ignored because it is from the old checkpoint.
+        header = ('%i\n' % self.checkpoint).encode('utf-8')
+        save_file(self.journal, header, False)
+        self.offset = len(header)
+        self.save_status()
+    
+    
+    def save_status(self):
+        '''
+        Save the new-article count file
+        '''
+        status = ('%i\n' % self.index.total_new()).encode('utf-8')
+        save_file('%s/status' % root, status, False)
@@ -16,132 +16,139 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+import time
 import xml.parsers.expat
 
+from dates import *
+from profiler import *
+
 ### News syndication feed parsing. ###
 
 
 
-def parse_feed(feed):
+FIELDS = { ('rss', True)   : { 'title'       : 'title',
+                                'description' : 'description',
+                                'link'        : 'link',
+                                'guid'        : 'guid',
+                                'pubdate'     : 'pubdate' },
+           ('rss', False)  : { 'title'       : 'title',
+                                'description' : 'description',
+                                'link'        : 'link' },
+           ('atom', True)  : { 'title'       : 'title',
+                                'id'          : 'guid',
+                                'summary'     : 'description',
+                                'content'     : 'description',
+                                'link'        : 'link',
+                                'updated'     : 'pubdate' },
+           ('atom', False) : { 'title'       : 'title',
+                                'subtitle'    : 'description',
+                                'link'        : 'link' } }
+'''
+:dict<(str, bool), dict<str, str>>  Map from the format of the feed, and whether we are in an item,
+                                    to map from the names of the elements whose text is stored,
+                                    to the key it is stored under
+'''
+
+FIELD_LIMITS = { 'title'       : 4 << 10,
+                 'link'        : 4 << 10,
+                 'guid'        : 4 << 10,
+                 'pubdate'     : 256,
+                 'description' : 1 << 20 }
+'''
+:dict<str, int>  Map from keys, under which text is stored, to the maximum number of
+                 characters that are stored, the rest of the text is ignored
+'''
+
+
+class EarlyStop(Exception):
     '''
-    Parse a feed file
+    Raised by the parser when the rest of the feed file does not need to be parsed
+    '''
+    pass
+
+
+def item_guid(item):
+    '''
+    Get the GUID of an item, defaulting to its link, or its title
+    
+    @param   item:dict  The item
+    @return  :str?      The GUID of the item
+    '''
+    for key in ('guid', 'link', 'title'):
+        if key in item:
+            return item[key]
+    return None
+
+
+def create_parser(feeds, ready, known = None, stop_after = None, limits = None):
+    '''
+    Create a parser for feed files
+    
+    If `known` and `stop_after` are specified, `EarlyStop` is raised from the parser
+    after `stop_after` consecutive items with known GUID:s, but only as long
+    as the items are in order, latest first, because then all following
+    items are older and are most likely already known as well
     
-    @param   feed:str     The raw content of the feed file
-    @return  :list<dict>  The feed parsed, one dictionary per channel
+    @param   feeds:list<dict>          List to which the channels are added when they have
+                                       been parsed, with their 'items' left empty
+    @param   ready:list<(dict, dict)>  List to which items are added, with their channel,
+                                       when they have been parsed
+    @param   known:(str?)→bool?        Function that returns whether a GUID is already known
+    @param   stop_after:int?           The number of consecutive items with known GUID:s to stop after
+    @param   limits:dict<str, int>?    Map from keys, under which text is stored, to the maximum
+                                       number of characters to store, `FIELD_LIMITS` if `None`
+    @return  :xmlparser                The parser, the encoding of the file is detected by it
     '''
     parser = xml.parsers.expat.ParserCreate()
     
     is_rss = False
     is_atom = False
-    feeds = []
     root = None
     item = None
     text = None
     attrs = None
+    field = None
+    depth = 0
+    remaining = None
+    limits = FIELD_LIMITS if limits is None else limits
+    
+    def set_pubdate(seconds):
+        # Unparsable dates are left out, like missing ones.
+        if seconds is not None:
+            item['pubdate'] = split_time(seconds)
+            item['timestamp'] = seconds
+    
     
-    def rss_date(value):
-        value = value.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
-        while value.startswith(' '):
-            value = value[1:]
-        while value.endswith(' '):
-            value = value[:-1]
-        while '  ' in value:
-            value = value.replace('  ', ' ')
-        value = value.replace('UTC', '+0000').replace('GMT', '+0000')
-        value = value.replace(':', ' ').split(' ')
-        (_, day, month, year, hour, minute, second, offset) = value
-        offsign, offhour, offmin = offset[0] == '+', offset[1 : 3], offset[3 : 5]
-        year, month, day = int(year), month.lower(), int(day)
-        hour, minute, second = int(hour), int(minute), int(second)
-        offhour, offmin = int(offhour), int(offmin)
-        months = ['', 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
-        for m in range(len(months)):
-            if month == months[m]:
-                month = m
-                break
-        if offsign:
-            hour += offhour
-            minute += offmin
-        else:
-            hour -= offhour
-            minute -= offmin
-        while minute < 0:
-            hour -= 1
-            minute += 60
-        if minute >= 60:
-            hour += minute // 60
-            minute %= 60
-        while hour < 0:
-            day -= 1
-            hour += 24
-        if hour >= 24:
-            day += hour // 24
-            hour %= 24
-        mds = [0, 31, 30, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-        while day <= 0:
-            month -= 1
-            if month <= 0:
-                month += 12
-                year -= 1
-            day += mds[month]
-        while day > mds[month]:
-            day -= mds[month]
-            month += 1
-            if month > 12:
-                month -= 12
-                year += 1
-        return [year, month, day, hour, minute, day]
-    
-    def atom_date(value):
-        value = value.replace(' ', '').replace('\t', '').replace('\n', '').replace('\r', '')
-        value = value.replace('Z', '+0000').replace('+', 'T+')
-        if '+' not in value:
-            value = '-'.join(value.split('-')[:-1]) + 'T-' + value.split('-')[-1]
-        (year, month, day) = value.split('T')[0].split('-')
-        (hour, minute, second) = value.split('T')[1].split(':')
-        offset = value.split('T')[2].replace(':', '')
-        offsign, offhour, offmin = offset[0] == '+', offset[1 : 3], offset[3 : 5]
-        year, month, day = int(year), int(month), int(day)
-        hour, minute, second = int(hour), int(minute), int(second.split('.')[0])
-        offhour, offmin = int(offhour), int(offmin)
-        if offsign:
-            hour += offhour
-            minute += offmin
-        else:
-            hour -= offhour
-            minute -= offmin
-        while minute < 0:
-            hour -= 1
-            minute += 60
-        if minute >= 60:
-            hour += minute // 60
-            minute %= 60
-        while hour < 0:
-            day -= 1
-            hour += 24
-        if hour >= 24:
-            day += hour // 24
-            hour %= 24
-        mds = [0, 31, 30, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-        while day <= 0:
-            month -= 1
-            if month <= 0:
-                month += 12
-                year -= 1
-            day += mds[month]
-        while day > mds[month]:
-            day -= mds[month]
-            month += 1
-            if month > 12:
-                month -= 12
-                year += 1
-        return [year, month, day, hour, minute, day]
+    consecutive = 0
+    ordered = True
+    last = None
+    
+    def item_done():
+        nonlocal consecutive, ordered, last
+        ready.append((root, item))
+        if (known is None) or (stop_after is None):
+            return
+        # Is the feed still in order, latest first?
+        pubdate = item['pubdate'] if 'pubdate' in item else None
+        if (pubdate is None) or ((last is not None) and (pubdate > last)):
+            ordered = False
+        last = pubdate
+        consecutive = (consecutive + 1) if known(item_guid(item)) else 0
+        if ordered and (consecutive >= stop_after):
+            # The channel would otherwise be added when it ends.
+            if not any(channel is root for channel in feeds):
+                feeds.append(root)
+            raise EarlyStop()
     
     
     def start_element(name, attributes):
-        nonlocal is_rss, feeds, root, item, text, is_atom, attrs
-        attrs = attributes
+        nonlocal is_rss, feeds, root, item, text, is_atom, attrs, field, depth, remaining
         name = name.lower()
+        # Elements inside a stored element, such as XHTML in Atom content, are part of its text.
+        if field is not None:
+            depth += 1
+            return
+        attrs = attributes
         if is_rss:
             if root is None:
                 if name == 'channel':
@@ -159,21 +166,33 @@ def parse_feed(feed):
         elif name == 'feed':
             is_atom = True
             root = {'items' : []}
-        text = ''
+        # Only collect the text of elements that are stored.
+        if (root is not None) and (is_rss or is_atom):
+            fields = FIELDS[('rss' if is_rss else 'atom', item is not None)]
+            if name in fields:
+                field, depth, text = name, 0, []
+                remaining = limits[fields[name]] if fields[name] in limits else None
     
     
     def end_element(name):
-        nonlocal is_rss, feeds, root, item, text, is_atom, attrs
+        nonlocal is_rss, feeds, root, item, text, is_atom, attrs, field, depth
         name = name.lower()
+        if field is not None:
+            # End of an element inside a stored element?
+            if depth > 0:
+                depth -= 1
+                return
+            # Join the text once, rather than for each piece.
+            field, text = None, ''.join(text)
         if (root is not None) and is_rss:
             if item is not None:
                 if name == 'item':
-                    root['items'].append(item)
+                    item_done()
                     item = None
                 elif name in ('title', 'description', 'link', 'guid'):
                     item[name] = text
                 elif name == 'pubdate':
-                    item['pubdate'] = rss_date(text)
+                    set_pubdate(rss_date(text))
             else:
                 if name in ('title', 'description', 'link'):
                     root[name] = text
@@ -185,7 +204,7 @@ def parse_feed(feed):
         elif (root is not None) and is_atom:
             if item is not None:
                 if name == 'entry':
-                    root['items'].append(item)
+                    item_done()
                     item = None
                 elif name == 'title':
                     item['title'] = text
@@ -200,7 +219,7 @@ def parse_feed(feed):
                     if 'rel' not in attrs:
                         item['link'] = text
                 elif name == 'updated':
-                    item['pubdate'] = atom_date(text)
+                    set_pubdate(atom_date(text))
             else:
                 if name == 'title':
                     root['title'] = text
@@ -217,16 +236,85 @@ def parse_feed(feed):
     
     
     def char_data(data):
-        nonlocal text
-        if text is not None:
-            text += data
+        nonlocal remaining
+        if field is not None:
+            if remaining is None:
+                text.append(data)
+            elif remaining > 0:
+                text.append(data[:remaining])
+                remaining -= len(data)
     
     
     parser.StartElementHandler = start_element
     parser.EndElementHandler = end_element
     parser.CharacterDataHandler = char_data
     
-    parser.Parse(feed, True)
+    return parser
+
+
+def iter_items(source, known = None, stop_after = None, feeds = None):
+    '''
+    Parse a feed file as it is read, and yield its items as soon as they
+    have been parsed, neither the file nor its items are kept in memory
     
-    return feeds
+    Each item is yielded with its channel, the channel's header, that is,
+    its title, link and description, is available when its first item is
+    yielded, unless the file places it after the items
+    
+    @param   source:str|bytes|itr<bytes>  The raw content of the feed file, whole or in pieces,
+                                          the pieces are closed, if they can be, when parsing
+                                          stops early
+    @param   known:(str?)→bool?           Function that returns whether a GUID is already known
+    @param   stop_after:int?              Stop parsing after this number of consecutive items
+                                          with known GUID:s, see `create_parser`
+    @param   feeds:list<dict>?            List to which the channels are added when they have
+                                          been parsed, with their 'items' left empty
+    @return  :itr<(dict, dict)>           The channels and the items, in the order the items
+                                          appear in the file
+    '''
+    chunks = [source] if isinstance(source, (str, bytes)) else source
+    ready = []
+    parser = create_parser([] if feeds is None else feeds, ready, known, stop_after)
+    empty = True
+    # Time spent parsing, not reading or processing the items.
+    parsing = 0
+    def parse(data, final):
+        nonlocal parsing
+        start = time.perf_counter()
+        try:
+            parser.Parse(data, final)
+        finally:
+            parsing += time.perf_counter() - start
+    try:
+        try:
+            for chunk in chunks:
+                empty = empty and (len(chunk) == 0)
+                parse(chunk, False)
+                yield from ready
+                ready.clear()
+            # A missing file has no items, rather than being malformed.
+            if not empty:
+                parse(b'', True)
+        except EarlyStop:
+            # Stop reading, and downloading, the rest of the file.
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        yield from ready
+    finally:
+        profiler.record('parse', parsing)
+
 
+def parse_feed(feed, known = None, stop_after = None):
+    '''
+    Parse a feed file
+    
+    @param   feed:str|bytes      The raw content of the feed file
+    @param   known:(str?)→bool?  Function that returns whether a GUID is already known
+    @param   stop_after:int?     Stop parsing after this number of consecutive items
+                                 with known GUID:s, see `create_parser`
+    @return  :list<dict>         The feed parsed, one dictionary per channel
+    '''
+    feeds = []
+    for (channel, item) in iter_items(feed, known, stop_after, feeds):
+        channel['items'].append(item)
+    return feeds
@@ -0,0 +1,262 @@
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import sys
+import time
+import atexit
+
+### Timing of the phases of a run, for `--profile`. ###
+
+
+
+PHASES = ['fetch', 'parse', 'content load', 'content save', 'metadata load', 'metadata save',
+          'tree build', 'print tree', 'render', 'lock wait']
+'''
+:list<str>  The phases that are timed, in the order they are listed in the summary
+'''
+
+
+class Profiler():
+    '''
+    Collects the durations of the phases of a run, when enabled, and
+    writes a summary of them, and a cProfile dump, when the run ends
+    
+    @variable  enabled:bool                    Are durations collected?
+    @variable  samples:dict<str, list<float>>  Map from phases to their durations, in seconds
+    @variable  output:str?                     The file to write the summary to, `None` for stderr
+    @variable  cprofile:Profile?               The cProfile profiler, if a dump is written
+    @variable  started:float                   When the profiler was started, in monotonic time
+    '''
+    
+    def __init__(self):
+        '''
+        Constructor, the profiler starts disabled
+        '''
+        self.enabled = False
+        self.samples = {}
+        self.output = None
+        self.cprofile = None
+        self.started = 0
+    
+    
+    def start(self, output = None):
+        '''
+        Start collecting, the summary is written when the process exits
+        
+        @param  output:str?  The file to write the summary to, `None` for stderr, if
+                             specified, a full cProfile dump is written to `output + '.pstats'`
+        '''
+        self.enabled = True
+        self.output = output
+        self.started = time.monotonic()
+        if output is not None:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        atexit.register(self.finish)
+    
+    
+    def record(self, phase, seconds):
+        '''
+        Add the duration of a phase
+        
+        @param  phase:str      The phase
+        @param  seconds:float  The duration
+        '''
+        if self.enabled:
+            # This is called from several threads, `setdefault` and `append`
+            # are atomic, so no thread's list replaces another's.
+            self.samples.setdefault(phase, []).append(seconds)
+    
+    
+    def phase(self, phase):
+        '''
+        Time a phase, use as a context manager: `with profiler.phase('parse'):`
+        
+        @param   phase:str  The phase
+        @return  :Phase?    The context manager, `NOT_TIMED` if the profiler is disabled
+        '''
+        return Phase(self, phase) if self.enabled else NOT_TIMED
+    
+    
+    def timed(self, phase, iterable):
+        '''
+        Time the production of the elements of an iterable, as one duration
+        
+        @param   phase:str      The phase
+        @param   iterable:itr   The iterable, it is closed when the returned iterable is
+        @return  :itr           The iterable, wrapped if the profiler is enabled
+        '''
+        if not self.enabled:
+            return iterable
+        def timed_iterable(iterator):
+            elapsed = 0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        element = next(iterator)
+                    except StopIteration:
+                        break
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield element
+            finally:
+                if hasattr(iterator, 'close'):
+                    iterator.close()
+                self.record(phase, elapsed)
+        return timed_iterable(iter(iterable))
+    
+    
+    def drain(self):
+        '''
+        Take the collected durations, so they can be sent to another process
+        
+        @return  :dict<str, list<float>>?  The durations, by phase, `None` if the profiler is disabled
+        '''
+        if not self.enabled:
+            return None
+        samples = self.samples
+        self.samples = {}
+        return samples
+    
+    
+    def merge(self, samples):
+        '''
+        Add durations collected by another process
+        
+        @param  samples:dict<str, list<float>>?  The durations, by phase, from `drain`
+        '''
+        for (phase, seconds) in ({} if samples is None else samples).items():
+            for duration in seconds:
+                self.record(phase, duration)
+    
+    
+    def summary(self):
+        '''
+        Make a summary of the collected durations
+        
+        @return  :str  The summary, a table with the count, total, and
+                       percentiles, in milliseconds, of each phase
+        '''
+        def percentile(values, fraction):
+            return values[min(max(int(len(values) * fraction + 0.5) - 1, 0), len(values) - 1)] * 1000
+        lines = ['run %.1f ms' % ((time.monotonic() - self.started) * 1000)]
+        lines.append('%-14s %8s %10s %9s %9s %9s %9s' % ('phase', 'count', 'total', 'p50', 'p90', 'p99', 'max'))
+        phases = PHASES + sorted(phase for phase in self.samples if phase not in PHASES)
+        for phase in phases:
+            if phase not in self.samples:
+                continue
+            values = sorted(self.samples[phase])
+            lines.append('%-14s %8i %10.1f %9.3f %9.3f %9.3f %9.3f' %
+                         (phase, len(values), sum(values) * 1000, percentile(values, 0.5),
+                          percentile(values, 0.9), percentile(values, 0.99), values[-1] * 1000))
+        return '\n'.join(lines) + '\n'
+    
+    
+    def finish(self):
+        '''
+        Stop collecting, and write the summary and the cProfile dump
+        '''
+        if not self.enabled:
+            return
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats('%s.pstats' % self.output)
+        summary = self.summary()
+        self.enabled = False
+        if self.output is None:
+            sys.stderr.write(summary)
+        else:
+            with open(self.output, 'w') as file:
+                file.write(summary)
+
+
+class Phase():
+    '''
+    Context manager that times a phase
+    
+    @variable  profiler:Profiler  The profiler to add the duration to
+    @variable  phase:str          The phase
+    @variable  start:float        When the phase started, in `time.perf_counter` time
+    '''
+    
+    def __init__(self, profiler, phase):
+        '''
+        Constructor
+        
+        @param  profiler:Profiler  The profiler to add the duration to
+        @param  phase:str          The phase
+        '''
+        self.profiler = profiler
+        self.phase = phase
+        self.start = 0
+    
+    
+    def __enter__(self):
+        '''
+        Start timing
+        
+        @return  :Phase  `self`
+        '''
+        self.start = time.perf_counter()
+        return self
+    
+    
+    def __exit__(self, *_exc):
+        '''
+        Stop timing, and add the duration
+        
+        @return  :bool  `False`, exceptions are not suppressed
+        '''
+        self.profiler.record(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+class NotTimed():
+    '''
+    Context manager that does nothing, used when the profiler is disabled
+    '''
+    
+    def __enter__(self):
+        '''
+        Do nothing
+        
+        @return  :NotTimed  `self`
+        '''
+        return self
+    
+    
+    def __exit__(self, *_exc):
+        '''
+        Do nothing
+        
+        @return  :bool  `False`, exceptions are not suppressed
+        '''
+        return False
+
+
+NOT_TIMED = NotTimed()
+'''
+:NotTimed  The context manager used when the profiler is disabled
+'''
+
+profiler = Profiler()
+'''
+:Profiler  The profiler of this process
+'''
@@ -0,0 +1,423 @@
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import hashlib
+import threading
+from html.parser import HTMLParser
+from subprocess import Popen, PIPE
+
+from common import *
+from common import _
+from profiler import *
+
+### Conversion of articles from HTML to pony-readable text. ###
+
+
+
+CACHE_SIZE = 16 << 20
+'''
+:int  The number of bytes the rendered articles in the cache may occupy
+'''
+
+prefetch_depth = os.environ['FEATHERWEIGHT_PREFETCH'] if 'FEATHERWEIGHT_PREFETCH' in os.environ else ''
+prefetch_depth = int(prefetch_depth) if prefetch_depth.isdigit() else 3
+'''
+:int  The number of unread articles to render, ahead of time, when an article is opened
+'''
+
+
+class Renderer(HTMLParser):
+    '''
+    Converts HTML to plain text, wrapped to the width of the terminal,
+    as it is fed to it
+    
+    @variable  width:int                 The width of the terminal
+    @variable  lines:list<str>           The finished lines
+    @variable  text:list<str>            The text of the current paragraph, as it was
+                                         given, its whitespace is collapsed when it ends
+    @variable  prefixes:list<str>        The strings that are printed before all lines of
+                                         the current paragraph, one per nested block
+    @variable  bullet:str?               The string that is printed before the first line
+                                         of the current paragraph, instead of its last prefix
+    @variable  lists:list<int?>          The numbers of the next items in the nested
+                                         lists, `None` for unordered lists
+    @variable  links:list<str>           The targets of the links, printed last, as notes
+    @variable  hrefs:list<(str?, int)>   The targets of the links that are open, and the
+                                         index in `text` where their text begins
+    @variable  heading:str?              The character to underline the current heading with
+    @variable  pre:int                   The number of open preformatted blocks
+    @variable  skip:int                  The number of open elements whose text is not shown
+    '''
+    
+    BLOCKS = {'p', 'div', 'section', 'article', 'header', 'footer', 'aside', 'nav',
+              'figure', 'figcaption', 'table', 'dl', 'dt', 'address', 'center'}
+    '''
+    :set<str>  Elements that are separated from the surrounding text by an empty line
+    '''
+    
+    SKIP = {'script', 'style', 'head', 'title', 'noscript'}
+    '''
+    :set<str>  Elements whose text is not shown
+    '''
+    
+    def __init__(self, width):
+        '''
+        Constructor
+        
+        @param  width:int  The width of the terminal
+        '''
+        HTMLParser.__init__(self, convert_charrefs = True)
+        self.width = max(width, 20)
+        self.lines = []
+        self.text = []
+        self.prefixes = []
+        self.bullet = None
+        self.lists = []
+        self.links = []
+        self.hrefs = []
+        self.heading = None
+        self.pre = 0
+        self.skip = 0
+    
+    
+    def paragraph(self, blank):
+        '''
+        Finish the current paragraph
+        
+        @param  blank:bool  Should the next paragraph be separated by an empty line?
+        '''
+        text = ''.join(self.text).split()
+        self.text = []
+        # The text of open links continues in the next paragraph.
+        self.hrefs = [(href, 0) for (href, _start) in self.hrefs]
+        prefix = ''.join(self.prefixes)
+        first = prefix if self.bullet is None else ''.join(self.prefixes[:-1]) + self.bullet
+        if len(text) > 0:
+            start = len(self.lines)
+            # Fill lines greedily, a word longer than a line gets a line of its own.
+            line = first + text[0]
+            for word in text[1:]:
+                if len(line) + 1 + len(word) > self.width:
+                    self.lines.append(line)
+                    line = prefix + word
+                else:
+                    line += ' ' + word
+            self.lines.append(line)
+            self.bullet = None
+            # Underline headings.
+            if self.heading is not None:
+                longest = max(len(line) for line in self.lines[start:])
+                self.lines.append(prefix + self.heading * (longest - len(prefix)))
+        if blank and (len(self.lines) > 0) and not (self.lines[-1] == ''):
+            self.lines.append('')
+    
+    
+    def handle_starttag(self, tag, attrs):
+        '''
+        Handle the start of an element
+        
+        @param  tag:str                  The name of the element
+        @param  attrs:list<(str, str?)>  The attributes of the element
+        '''
+        attrs = dict(attrs)
+        if tag in Renderer.SKIP:
+            self.skip += 1
+        elif tag == 'br':
+            if self.pre > 0:
+                self.text.append('\n')
+            else:
+                self.paragraph(False)
+        elif tag == 'hr':
+            self.paragraph(True)
+            self.lines.append(''.join(self.prefixes) + '─' * (self.width // 2))
+            self.lines.append('')
+        elif tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            self.paragraph(True)
+            self.heading = '=' if tag in ('h1', 'h2') else '-'
+        elif tag in Renderer.BLOCKS:
+            self.paragraph(True)
+        elif tag in ('tr', 'dd'):
+            self.paragraph(False)
+        elif tag in ('td', 'th'):
+            self.text.append(' ')
+        elif tag == 'blockquote':
+            self.paragraph(True)
+            self.prefixes.append('> ')
+        elif tag in ('ul', 'ol'):
+            self.paragraph(len(self.lists) == 0)
+            self.lists.append(None if tag == 'ul' else 1)
+        elif tag == 'li':
+            self.paragraph(False)
+            if len(self.lists) == 0:
+                self.lists.append(None)
+            number = self.lists[-1]
+            if number is None:
+                self.bullet = '* ' if islinux else '• '
+            else:
+                self.bullet = '%i. ' % number
+                self.lists[-1] += 1
+            self.prefixes.append(' ' * len(self.bullet))
+        elif tag == 'pre':
+            self.paragraph(True)
+            self.pre += 1
+        elif tag == 'a':
+            self.hrefs.append((attrs['href'] if 'href' in attrs else None, len(self.text)))
+        elif tag == 'img':
+            alt = attrs['alt'] if 'alt' in attrs else None
+            self.handle_data('[%s]' % (_('image') if (alt is None) or (alt == '') else alt))
+    
+    
+    def handle_endtag(self, tag):
+        '''
+        Handle the end of an element
+        
+        @param  tag:str  The name of the element
+        '''
+        if tag in Renderer.SKIP:
+            self.skip = max(self.skip - 1, 0)
+        elif tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            self.paragraph(True)
+            self.heading = None
+        elif tag in Renderer.BLOCKS:
+            self.paragraph(True)
+        elif tag == 'blockquote':
+            self.paragraph(True)
+            if len(self.prefixes) > 0:
+                self.prefixes.pop()
+        elif tag in ('ul', 'ol'):
+            self.paragraph(len(self.lists) == 1)
+            if len(self.lists) > 0:
+                self.lists.pop()
+        elif tag == 'li':
+            self.paragraph(False)
+            if len(self.prefixes) > 0:
+                self.prefixes.pop()
+        elif tag == 'pre':
+            # Print preformatted text as is, but indented.
+            prefix = ''.join(self.prefixes)
+            text = ''.join(self.text).strip('\n')
+            self.text = []
+            self.lines += [prefix + line for line in text.split('\n')]
+            self.lines.append('')
+            self.pre = max(self.pre - 1, 0)
+        elif (tag == 'a') and (len(self.hrefs) > 0):
+            (href, start) = self.hrefs.pop()
+            text = ''.join(self.text[start:]).strip()
+            # Number links whose target is not their text, and list them at the end.
+            # The number is attached to the end of the text, without a space.
+            if (href is not None) and not (text == '') and not (text == href):
+                if href not in self.links:
+                    self.links.append(href)
+                last = self.text[-1]
+                self.text[-1] = last.rstrip()
+                self.text.append('[%i]%s' % (self.links.index(href) + 1, last[len(last.rstrip()):]))
+    
+    
+    def handle_data(self, data):
+        '''
+        Handle text
+        
+        @param  data:str  The text
+        '''
+        if self.skip == 0:
+            self.text.append(data)
+    
+    
+    def close(self):
+        '''
+        Finish the conversion
+        
+        @return  :str  The text
+        '''
+        HTMLParser.close(self)
+        self.paragraph(True)
+        if len(self.links) > 0:
+            self.lines += ['[%i] %s' % (i + 1, link) for (i, link) in enumerate(self.links)]
+        while (len(self.lines) > 0) and (self.lines[-1] == ''):
+            self.lines.pop()
+        return '\n'.join(self.lines) + '\n'
+
+
+
+def render_html(html, width):
+    '''
+    Convert HTML to pony-readable text
+    
+    If the environment variable FEATHERWEIGHT_HTML is set, and not empty,
+    it is used, as a command, to convert the HTML instead
+    
+    @param   html:bytes  The HTML, in UTF-8
+    @param   width:int   The width of the terminal
+    @return  :bytes      The text, in UTF-8
+    '''
+    if ('FEATHERWEIGHT_HTML' in os.environ) and (not os.environ['FEATHERWEIGHT_HTML'] == ''):
+        proc = ['sh', '-c', os.environ['FEATHERWEIGHT_HTML']]
+        proc = Popen(proc, stdin = PIPE, stdout = PIPE, stderr = sys.stderr)
+        return proc.communicate(html)[0]
+    renderer = Renderer(width)
+    html = html.decode('utf-8', 'replace')
+    # Feed the parser in chunks, so it does not have to hold the entire article twice.
+    for i in range(0, len(html), 1 << 14):
+        renderer.feed(html[i : i + (1 << 14)])
+    return renderer.close().encode('utf-8')
+
+
+def article_html(node):
+    '''
+    Get the HTML to display for an article
+    
+    @param   node:dict<str, _>  The article's node
+    @return  :bytes             The HTML, in UTF-8
+    '''
+    description = ''
+    if 'link' in node:
+        description += '%s<br><br>' % (_('Link: %s') % node['link'])
+    if 'description' in node:
+        description += node['description']
+    return description.encode('utf-8')
+
+
+def render_article(node, width):
+    '''
+    Get an article in pony-readable format, from the cache if it
+    has been rendered before, and store it in the cache otherwise
+    
+    Each article has one file in the cache, named by its GUID, it
+    begins with a line with a hash of everything that affects
+    the rendering, the entry is rendered again if that has changed
+    
+    @param   node:dict<str, _>  The article's node
+    @param   width:int          The width of the terminal
+    @return  :bytes             The text, in UTF-8
+    '''
+    html = article_html(node)
+    command = os.environ['FEATHERWEIGHT_HTML'] if 'FEATHERWEIGHT_HTML' in os.environ else ''
+    key = hashlib.sha1(('%i\0%s\0' % (width, command)).encode('utf-8') + html).hexdigest().encode('utf-8')
+    pathname = '%s/cache/%s' % (root, hashlib.sha1(node['guid'].encode('utf-8')).hexdigest())
+    # Use the cached text, if it is up to date.
+    try:
+        with open(pathname, 'rb') as file:
+            if file.readline() == key + b'\n':
+                text = file.read()
+                # Mark it as recently used.
+                os.utime(pathname)
+                return text
+    except OSError:
+        pass
+    with profiler.phase('render'):
+        text = render_html(html, width)
+    # Cache it, but do not fail if we cannot.
+    try:
+        if not os.path.exists('%s/cache' % root):
+            os.makedirs('%s/cache' % root)
+        save_file(pathname, key + b'\n' + text, False)
+        evict_cache()
+    except OSError:
+        pass
+    return text
+
+
+def evict_cache():
+    '''
+    Remove the least recently used articles from the cache, if it is larger than `CACHE_SIZE`
+    '''
+    directory = '%s/cache' % root
+    entries = []
+    for name in os.listdir(directory):
+        try:
+            stat = os.stat('%s/%s' % (directory, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        except OSError:
+            # Removed by another process.
+            pass
+    size = sum(entry[1] for entry in entries)
+    if size <= CACHE_SIZE:
+        return
+    # Remove down to three quarters of the limit, so we do not have to do this again soon.
+    entries.sort()
+    for (_mtime, entry_size, name) in entries:
+        if size <= CACHE_SIZE * 3 // 4:
+            break
+        try:
+            os.unlink('%s/%s' % (directory, name))
+        except OSError:
+            pass
+        size -= entry_size
+
+
+
+class Prefetcher():
+    '''
+    A thread that renders articles, into the cache, before they are opened
+    
+    Only the articles' GUID:s, links and descriptions are kept, and at most
+    `prefetch_depth` of them, and the rendered text is not kept in memory
+    
+    @variable  queue:list<(dict<str, str>, int)>  The articles to render, and the terminal width
+    @variable  condition:threading.Condition      Guards `queue`
+    @variable  thread:threading.Thread?           The thread, `None` until the first prefetch
+    '''
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.queue = []
+        self.condition = threading.Condition()
+        self.thread = None
+    
+    
+    def prefetch(self, nodes, width):
+        '''
+        Render articles in the background, replacing those not yet rendered
+        
+        @param  nodes:itr<dict<str, _>>  The articles' nodes, most likely to be opened first
+        @param  width:int                The width of the terminal
+        '''
+        keys = ('guid', 'link', 'description')
+        nodes = [dict((key, node[key]) for key in keys if key in node) for node in nodes]
+        with self.condition:
+            self.queue = [(node, width) for node in nodes[:prefetch_depth]]
+            if (self.thread is None) and (len(self.queue) > 0):
+                self.thread = threading.Thread(target = self.run, daemon = True)
+                self.thread.start()
+            self.condition.notify_all()
+    
+    
+    def run(self):
+        '''
+        Render articles, forever
+        '''
+        while True:
+            with self.condition:
+                while len(self.queue) == 0:
+                    self.condition.wait()
+                (node, width) = self.queue.pop(0)
+            try:
+                render_article(node, width)
+            except:
+                # It will be rendered again when it is opened.
+                pass
+
+
+prefetcher = Prefetcher()
+'''
+:Prefetcher  The prefetcher used to render articles ahead of time
+'''
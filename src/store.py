@@ -0,0 +1,192 @@
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import time
+import fcntl
+
+from common import *
+from profiler import *
+
+### The content files of the feeds, and their logs. ###
+
+
+
+COMPACT_SIZE = 256 << 10
+'''
+:int  The size, in bytes, a content log may grow to before
+      it is merged into its content file
+'''
+
+
+def log_pathname(feed_id):
+    '''
+    Get the pathname of the content log of a feed
+    
+    The log has one record per line: `('add', item)` for a new article,
+    `('edit', guid, values)` for changes to an article, with `...` as the
+    value for keys that should be deleted, and `('delete', guids)` for
+    deleted articles. A record is not complete until its line is
+    
+    Processes lock only the parts of the log they use, with byte-range
+    locks: records are appended with a lock from the end of the log, and
+    readers lock the records that are there when they start, so appending
+    and reading do not wait for each other, only compaction, which locks
+    the whole log, waits for, and is waited for by, both
+    
+    @param   feed_id:str  The ID of the feed
+    @return  :str         The pathname of the feed's content log
+    '''
+    return '%s/%s-content.log' % (root, feed_id)
+
+
+def log_records(feed_id, records):
+    '''
+    Append changes to the content of a feed to its content log
+    
+    @param  feed_id:str             The ID of the feed
+    @param  records:itr<(str, *_)>  The changes, see `log_pathname`
+    '''
+    data = ''.join('%s\n' % repr(record) for record in records).encode('utf-8')
+    fd = os.open(log_pathname(feed_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        # Lock the log from its end, retry if it was compacted while we waited.
+        while True:
+            start = os.fstat(fd).st_size
+            with profiler.phase('lock wait'):
+                fcntl.lockf(fd, fcntl.LOCK_EX, 0, start)
+            if os.fstat(fd).st_size >= start:
+                break
+            fcntl.lockf(fd, fcntl.LOCK_UN, 0, start)
+        with profiler.phase('content save'):
+            os.write(fd, data)
+            if sync:
+                os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def apply_records(content, records):
+    '''
+    Apply changes from a content log to the content of a feed
+    
+    Applying a record twice has no effect, so a log that was
+    merged into the content file, but not emptied, does no harm
+    
+    @param  content:list<dict<str, _>>  The articles, will be updated in place
+    @param  records:itr<(str, *_)>      The changes, see `log_pathname`
+    '''
+    entries = dict((entry['guid'], entry) for entry in content)
+    added = []
+    for record in records:
+        if record[0] == 'add':
+            if record[1]['guid'] not in entries:
+                entries[record[1]['guid']] = record[1]
+                added.append(record[1])
+        elif record[0] == 'edit':
+            (guid, values) = record[1:]
+            if guid in entries:
+                entry = entries[guid]
+                for key in values.keys():
+                    if values[key] == ...:
+                        if key in entry:
+                            del entry[key]
+                    else:
+                        entry[key] = values[key]
+        elif record[0] == 'delete':
+            deleted = set(guid for guid in record[1] if guid in entries)
+            if len(deleted) > 0:
+                content[:] = [entry for entry in content if entry['guid'] not in deleted]
+                added = [entry for entry in added if entry['guid'] not in deleted]
+                for guid in deleted:
+                    del entries[guid]
+    # The new articles are newer than the old articles, by and large,
+    # so this keeps the content cheap to sort.
+    content[:0] = added
+    sort_content(content)
+
+
+def read_content(feed_id, compact = False):
+    '''
+    Read the content of a feed, with the changes in its content log applied
+    
+    @param   feed_id:str          The ID of the feed
+    @param   compact:bool         Merge the log into the content file, and empty it? The
+                                  caller must hold an exclusive lock on the feed if so
+    @return  :list<dict<str, _>>  The articles, latest first
+    '''
+    pathname = log_pathname(feed_id)
+    fd = os.open(pathname, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        if compact:
+            # Lock the whole log, so nothing is appended while we merge it.
+            with profiler.phase('lock wait'):
+                fcntl.lockf(fd, fcntl.LOCK_EX, 0, 0)
+            size = None
+        else:
+            # Lock only the part of the log we read, so it is not compacted while
+            # we read the content file, but appends, which lock from the end, do
+            # not wait for us. Retry if it was compacted while we waited.
+            while True:
+                size = os.fstat(fd).st_size
+                if size == 0:
+                    break
+                with profiler.phase('lock wait'):
+                    fcntl.lockf(fd, fcntl.LOCK_SH, size, 0)
+                if os.fstat(fd).st_size >= size:
+                    break
+                fcntl.lockf(fd, fcntl.LOCK_UN, size, 0)
+        loading = time.perf_counter()
+        content = read_file('%s/%s-content' % (root, feed_id))
+        content = [] if content is None else content.decode('utf-8', 'strict')
+        content = eval(content) if len(content) > 0 else []
+        # Read the log through the locked descriptor, closing
+        # another descriptor would release our lock.
+        records = []
+        remaining = size
+        while (remaining is None) or (remaining > 0):
+            chunk = os.read(fd, 1 << 16 if remaining is None else min(remaining, 1 << 16))
+            if len(chunk) == 0:
+                break
+            records.append(chunk)
+            remaining = None if remaining is None else remaining - len(chunk)
+        records = b''.join(records)
+        # Ignore an incomplete record at the end, it is from a crash.
+        records = records[: records.rfind(b'\n') + 1].decode('utf-8', 'strict')
+        apply_records(content, [eval(record) for record in records.split('\n')[:-1]])
+        profiler.record('content load', time.perf_counter() - loading)
+        if compact and (len(records) > 0):
+            with profiler.phase('content save'):
+                save_file('%s/%s-content' % (root, feed_id), repr(content).encode('utf-8'))
+                os.ftruncate(fd, 0)
+    finally:
+        os.close(fd)
+    return content
+
+
+def compact_content(feed_id):
+    '''
+    Merge the content log of a feed into its content file, if the log is large
+    
+    The caller must hold an exclusive lock on the feed
+    
+    @param  feed_id:str  The ID of the feed
+    '''
+    pathname = log_pathname(feed_id)
+    if os.access(pathname, os.F_OK) and (os.stat(pathname).st_size >= COMPACT_SIZE):
+        read_content(feed_id, True)
@@ -18,8 +18,12 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 import os
 import sys
+import time
+import select
 from subprocess import Popen, PIPE
 
+from profiler import *
+
 ### Interactive tree. ###
 
 
@@ -43,95 +47,370 @@ ACTION_MAP = {'e' : 'edit',
 '''
 
 
-def remove_node(trees, node_id):
+class FeedIndex():
     '''
-    Remove the first found (depth first) occurrence of a node in a set of trees
+    Index of the nodes in a set of trees, by their identifiers
+    
+    The index must be kept in sync with the trees, which is done by
+    the functions below that modify the trees. With it, finding a node
+    or its ancestors does not require a search through the trees.
     
-    @param   trees:itr<dict<str, _|itr<↑>|¿I?>>  The trees
-    @param   node_id:¿I?                         The identifier for the node
-    @return  :bool                               Whether the node was found; intended for method internal use
+    @variable  feeds:list<dict<str, _|itr<↑>|¿I?>>      The trees
+    @variable  nodes:dict<¿I?, dict<str, _|itr<↑>>>     Map from identifiers to nodes
+    @variable  parents:dict<¿I?, dict<str, _|itr<↑>>?>  Map from identifiers to the nodes' parents,
+                                                        `None` for the roots of the trees
     '''
-    for i in range(len(trees)):
-        if ('id' in trees[i]) and (trees[i]['id'] == node_id):
-            del trees[i]
-            return True
-        if 'inner' in trees[i]:
-            if remove_node(trees[i]['inner'], node_id):
-                if len(trees[i]['inner']) == 0:
-                    del trees[i]['inner']
-                return True
-    return False
+    
+    def __init__(self, feeds):
+        '''
+        Constructor
+        
+        @param  feeds:list<dict<str, _|itr<↑>|¿I?>>  The trees
+        '''
+        self.feeds = feeds
+        self.nodes = {}
+        self.parents = {}
+        for feed in feeds:
+            self.add(feed, None)
+    
+    
+    def add(self, node, parent):
+        '''
+        Add a node, and all nodes inside it, to the index
+        
+        @param  node:dict<str, _|itr<↑>|¿I?>  The node
+        @param  parent:dict<str, _|itr<↑>>?   The parent of the node, `None` if it is a root
+        '''
+        self.nodes[node['id']] = node
+        self.parents[node['id']] = parent
+        if ('inner' in node) and (node['inner'] is not None):
+            for child in node['inner']:
+                self.add(child, node)
+    
+    
+    def discard(self, node):
+        '''
+        Remove a node, and all nodes inside it, from the index
+        
+        @param  node:dict<str, _|itr<↑>|¿I?>  The node
+        '''
+        del self.nodes[node['id']]
+        del self.parents[node['id']]
+        if ('inner' in node) and (node['inner'] is not None):
+            for child in node['inner']:
+                self.discard(child)
+    
+    
+    def ancestors(self, node_id):
+        '''
+        List the ancestors of a node
+        
+        @param   node_id:¿I?                     The identifier for the node
+        @return  :list<dict<str, _|itr<↑>|¿I?>>  The ancestors, the parent first
+        '''
+        rc = []
+        parent = self.parents[node_id]
+        while parent is not None:
+            rc.append(parent)
+            parent = self.parents[parent['id']]
+        return rc
+    
+    
+    def siblings(self, node_id):
+        '''
+        Get the list a node is stored in
+        
+        @param   node_id:¿I?                     The identifier for the node
+        @return  :list<dict<str, _|itr<↑>|¿I?>>  The children of the node's parent, or
+                                                 the trees if the node is a root
+        '''
+        parent = self.parents[node_id]
+        return self.feeds if parent is None else parent['inner']
+    
+    
+    def position(self, node_id):
+        '''
+        Get the position of a node among its siblings
+        
+        @param   node_id:¿I?  The identifier for the node
+        @return  :int         The index of the node in `self.siblings(node_id)`
+        '''
+        node = self.nodes[node_id]
+        siblings = self.siblings(node_id)
+        for i in range(len(siblings)):
+            if siblings[i] is node:
+                return i
+    
+    
+    def total_new(self):
+        '''
+        Get the number of new entries in all trees
+        
+        @return  :int  The sum of the 'new' values of the roots
+        '''
+        return sum(feed['new'] for feed in self.feeds if 'new' in feed)
+    
+    
+    def propagate_new(self, node_id, mod):
+        '''
+        Add to the 'new' value of the ancestors of a node
+        
+        @param  node_id:¿I?  The identifier for the node
+        @param  mod:int      How much to add to the 'new' values
+        '''
+        if not mod == 0:
+            for ancestor in self.ancestors(node_id):
+                ancestor['new'] += mod
 
 
 
-def insert_node(trees, node_id, node):
+def remove_node(index, node_id):
+    '''
+    Remove a node from a set of trees
+    
+    @param   index:FeedIndex  The index of the trees
+    @param   node_id:¿I?      The identifier for the node
+    @return  :bool            Whether the node was found
+    '''
+    if node_id not in index.nodes:
+        return False
+    node = index.nodes[node_id]
+    parent = index.parents[node_id]
+    # Remove its new-article count from its ancestors.
+    if 'new' in node:
+        index.propagate_new(node_id, -(node['new']))
+    # Remove the node, and mark its parent as a leaf if it becomes empty.
+    siblings = index.siblings(node_id)
+    del siblings[index.position(node_id)]
+    if (parent is not None) and (len(siblings) == 0):
+        del parent['inner']
+    index.discard(node)
+    return True
+
+
+
+def insert_node(index, node_id, node):
     '''
     Insert a new node into the tree
     
-    @param   trees:itr<dict<str, _|itr<↑>|¿I?>>  The trees
-    @param   node_id:¿I?                         The identifier for the new node's parent
-    @param   node:dict<str, _>                   The new node
-    @return  :bool                               Whether the node was found; intended for method internal use
+    @param   index:FeedIndex    The index of the trees
+    @param   node_id:¿I?        The identifier for the new node's parent
+    @param   node:dict<str, _>  The new node
+    @return  :bool              Whether the parent was found
     '''
     if node_id is None:
-        trees.append(node)
-        return True
-    for i in range(len(trees)):
-        if ('id' in trees[i]) and (trees[i]['id'] == node_id):
-            if 'inner' not in trees[i]:
-                trees[i]['inner'] = []
-            return insert_node(trees[i]['inner'], None, node)
-        if 'inner' in trees[i]:
-            if insert_node(trees[i]['inner'], node_id, node):
-                return True
-    return False
+        parent = None
+        index.feeds.append(node)
+    elif node_id not in index.nodes:
+        return False
+    else:
+        parent = index.nodes[node_id]
+        if 'inner' not in parent:
+            parent['inner'] = []
+        parent['inner'].append(node)
+    index.add(node, parent)
+    if 'new' in node:
+        index.propagate_new(node['id'], node['new'])
+    return True
+
+
+
+def move_node(index, node_id, node_id_p, position):
+    '''
+    Move a node, keeping the new-article counts up to date
+    
+    @param   index:FeedIndex  The index of the trees
+    @param   node_id:¿I?      The identifier for the node
+    @param   node_id_p:¿I?    The identifier for the node's new parent, `None` for the roots
+    @param   position:int     The position of the node among its new siblings, after
+                              it has been removed from its old siblings
+    @return  :bool            Whether the node and its new parent were found
+    '''
+    if (node_id not in index.nodes) or not ((node_id_p is None) or (node_id_p in index.nodes)):
+        return False
+    node = index.nodes[node_id]
+    parent = index.parents[node_id]
+    new_parent = None if node_id_p is None else index.nodes[node_id_p]
+    new = node['new'] if 'new' in node else 0
+    # Remove the node from its old parent, and mark it as a leaf if it becomes empty.
+    index.propagate_new(node_id, -new)
+    siblings = index.siblings(node_id)
+    del siblings[index.position(node_id)]
+    if (parent is not None) and (len(siblings) == 0):
+        del parent['inner']
+    # Add the node to its new parent.
+    if new_parent is None:
+        siblings = index.feeds
+    else:
+        if 'inner' not in new_parent:
+            new_parent['inner'] = []
+        siblings = new_parent['inner']
+    siblings.insert(position, node)
+    index.parents[node_id] = new_parent
+    index.propagate_new(node_id, new)
+    return True
+
+
+
+def swap_nodes(index, node_id_i, node_id_j):
+    '''
+    Swap the positions of two adjacent nodes with the same parent
+    
+    @param   index:FeedIndex  The index of the trees
+    @param   node_id_i:¿I?    The identifier for one of the nodes
+    @param   node_id_j:¿I?    The identifier for the other node
+    @return  :bool            Whether the nodes were found, and are adjacent siblings
+    '''
+    if (node_id_i not in index.nodes) or (node_id_j not in index.nodes):
+        return False
+    if index.parents[node_id_i] is not index.parents[node_id_j]:
+        return False
+    i, j = index.position(node_id_i), index.position(node_id_j)
+    if not abs(i - j) == 1:
+        return False
+    siblings = index.siblings(node_id_i)
+    siblings[i], siblings[j] = siblings[j], siblings[i]
+    return True
 
 
 
-def update_node(trees, node_id, values):
+def update_node(index, node_id, values):
     '''
     Update the values of a node in a tree
     
-    @param   trees:itr<dict<str, _|itr<↑>|¿I?>>  The trees
-    @param   node_id:¿I?                         The identifier for the node
-    @param   values:dict<str, ¿?|...>            The new node values, mapping to `...` for deletion
-    @return  :bool                               Whether the node was found; intended for method internal use
+    @param   index:FeedIndex           The index of the trees
+    @param   node_id:¿I?               The identifier for the node
+    @param   values:dict<str, ¿?|...>  The new node values, mapping to `...` for deletion
+    @return  :bool                     Whether the node was found
     '''
-    for i in range(len(trees)):
-        if ('id' in trees[i]) and (trees[i]['id'] == node_id):
-            for key in values.keys():
-                value = values[key]
-                if value == ...:
-                    if key in trees[i]:
-                        del trees[i][key]
-                else:
-                    trees[i][key] = value
-            return True
-        if 'inner' in trees[i]:
-            if update_node(trees[i]['inner'], node_id, values):
-                return True
-    return False
+    if node_id not in index.nodes:
+        return False
+    node = index.nodes[node_id]
+    for key in values.keys():
+        value = values[key]
+        if value == ...:
+            if key in node:
+                del node[key]
+        else:
+            node[key] = value
+    return True
 
 
 
-def update_node_newness(trees, node_id, mod):
+def update_node_newness(index, node_id, mod):
     '''
     Update the 'new' value of a node and its ancestors
     
-    @param   trees:itr<dict<str, _|itr<↑>|¿I?>>  The trees
-    @param   node_id:¿I?                         The identifier for the node
-    @param   mod:int                             How much to add to the 'new' value
-    @return  :bool                               Whether the node was found; intended for method internal use
+    @param   index:FeedIndex  The index of the trees
+    @param   node_id:¿I?      The identifier for the node
+    @param   mod:int          How much to add to the 'new' value
+    @return  :bool            Whether the node was found
+    '''
+    if node_id not in index.nodes:
+        return False
+    index.nodes[node_id]['new'] += mod
+    index.propagate_new(node_id, mod)
+    return True
+
+
+
+
+def move_node_out(index, node_id, node_id_p):
+    '''
+    Move a node out of its parent, to the position of its parent in its grandparent
+    
+    @param   index:FeedIndex  The index of the trees
+    @param   node_id:¿I?      The identifier for the node
+    @param   node_id_p:¿I?    The identifier for the node's parent, the move is not
+                              made if it is not the node's parent anymore
+    @return  :bool            Whether the node was moved
     '''
-    for i in range(len(trees)):
-        if ('id' in trees[i]) and (trees[i]['id'] == node_id):
-            trees[i]['new'] += mod
-            return True
-        if 'inner' in trees[i]:
-            if update_node_newness(trees[i]['inner'], node_id, mod):
-                trees[i]['new'] += mod
-                return True
-    return False
+    # Another process may have modified the tree, so check that the node is still there.
+    if (node_id not in index.nodes) or (index.parents[node_id] is None):
+        return False
+    if not index.parents[node_id]['id'] == node_id_p:
+        return False
+    node_id_g = index.parents[node_id_p]
+    node_id_g = None if node_id_g is None else node_id_g['id']
+    return move_node(index, node_id, node_id_g, index.position(node_id_p))
+
+
+
+def move_node_in(index, node_id, node_id_m):
+    '''
+    Move a node into the group beneath it, as its first child
+    
+    @param   index:FeedIndex  The index of the trees
+    @param   node_id:¿I?      The identifier for the node
+    @param   node_id_m:¿I?    The identifier for the group, the move is not made if
+                              it is not the group beneath the node anymore
+    @return  :bool            Whether the node was moved
+    '''
+    # Another process may have modified the tree, so check that
+    # the node beneath the selected node has not changed.
+    if (node_id not in index.nodes) or (node_id_m not in index.nodes):
+        return False
+    if index.parents[node_id] is not index.parents[node_id_m]:
+        return False
+    if not index.position(node_id_m) == index.position(node_id) + 1:
+        return False
+    if index.nodes[node_id_m]['url'] is not None:
+        return False
+    return move_node(index, node_id, node_id_m, 0)
+
+
+
+RECORDS = { 'remove'  : remove_node,
+            'insert'  : insert_node,
+            'swap'    : swap_nodes,
+            'out'     : move_node_out,
+            'in'      : move_node_in,
+            'update'  : update_node,
+            'newness' : update_node_newness }
+'''
+:dict<str, (index:FeedIndex, *_)→bool>  Map from the names of changes to trees,
+                                        to the functions that make them
+'''
+
+
+def apply_record(index, record):
+    '''
+    Make a change to a tree
+    
+    Changes are stored as records so they can be written
+    to, and read back from, the feed list's journal
+    
+    @param   index:FeedIndex   The index of the trees
+    @param   record:(str, *_)  The name of the change, in `RECORDS`, followed
+                               by the arguments for its function, after `index`
+    @return  :bool             Whether the change could be made
+    '''
+    return RECORDS[record[0]](index, *(record[1:]))
+
+
+PREFIXES = {False : {(False, False) : '├─╼ ', (False, True) : '├─┚ ',
+                     (True,  False) : '└─╼ ', (True,  True) : '└─┚ '},
+            True  : {(False, False) : '├── ', (False, True) : '├─┘ ',
+                     (True,  False) : '└── ', (True,  True) : '└─┘ '}}
+'''
+:dict<bool, dict<(bool, bool), str>>  Map from whether we are running in Linux VT, to map
+                                      from whether a node is the last child in its parent
+                                      and whether it is a collapsed branch, to the string
+                                      that connects the node to the tree.
+'''
+
+INDENTS = {False : '│   ', True : '    '}
+'''
+:dict<bool, str>  Map from whether a node is the last child in its parent,
+                  to the indent string its children add to its indent string.
+'''
+
+REDRAW_INTERVAL = 1 / 30
+'''
+:float  The minimum number of seconds between two redraws whilst
+        there is still pending input, that is, the inverse of the
+        maximum frame rate when a key is held down.
+'''
 
 
 
@@ -146,14 +425,22 @@ class Tree():
     @variable  count:int                           The number of new items
     @variable  select_stack:list<(:Tree?, :int?)>  Stack of selected nodes, object and index
     @variable  collapsed_count:int                 The number of collapsed branches
-    @variable  line:int                            Used to keep track of whether the vision field
-                                                   must be adjusted to make the selected node visible
-    @variable  curline:int                         The current line, in the tree, being drawn
+    @variable  line:int?                           The line, in the tree, of the selected node,
+                                                   `None` if it has not been rendered yet
+    @variable  curline:int                         The current line, in the tree, being rendered
     @variable  lineoff:int                         The index of the first visible line
     @variable  draw_force:bool                     Do I need to redraw the screen?
-    @variable  draw_line:int                       The current line on the screen
-    @variable  last_select:Tree?                   The previously selected node.
-    @variable  redraw_root:bool                    Do I need to redraw the root?
+    @variable  rows:list<str>                      The frame being rendered, one string per line
+    @variable  frame:list<str>                     The frame currently on the screen
+    @variable  frame_size:(int, int)?              The size of the terminal when `frame` was drawn
+    @variable  prefixes:dict<(str, bool, bool), str>  Cache of the strings printed before the
+                                                   titles of nodes, by indent string, whether the
+                                                   node is the last child in its parent, and
+                                                   whether the node is a collapsed branch
+    @variable  draw_pending:bool                   Has the tree changed since it was last printed?
+    @variable  draw_time:float                     When the tree was last printed, in monotonic time
+    @variable  idle:(float, ()→void)?              Number of seconds the user may be idle before the
+                                                   function is called, at most once per wait for input
     '''
     
     def __init__(self, root, feeds):
@@ -169,32 +456,80 @@ class Tree():
         self.feeds = feeds
         
         self.islinux = ('TERM' not in os.environ) or (os.environ['TERM'] == 'linux')
-        self.count = Tree.count_new(feeds)
+        self.count = sum(feed['new'] for feed in feeds if 'new' in feed)
         
         self.select_stack = [(None, None)]
         self.collapsed_count = 0
         
         # Collapes all branches.
-        def autocollapse(feed):
-            if 'inner' in feed:
-                if ('new' not in feed) or (feed['new'] == 0):
-                    feed['expanded'] = False
-                    self.collapsed_count += 1
-                [autocollapse(feed) for feed in feed['inner']]
-        [autocollapse(feed) for feed in feeds]
+        [self.autocollapse(feed) for feed in feeds]
         
         # Get size of terminal.
-        height_width = Popen('stty size'.split(' '), stdout = PIPE, stderr = PIPE).communicate()[0]
-        (height, width) = height_width.decode('utf-8', 'strict')[:-1].split(' ')
-        height, width = int(height), int(width)
+        (height, width) = Tree.terminal_size()
         
-        self.line = 0
+        self.line = None
         self.curline = 0
         self.lineoff = 0
         self.draw_force = True
-        self.draw_line = 0
-        self.last_select = None
-        self.redraw_root = False
+        self.rows = []
+        self.frame = []
+        self.frame_size = None
+        self.prefixes = {}
+        self.draw_pending = True
+        self.draw_time = 0
+        self.idle = None
+    
+    
+    @staticmethod
+    def terminal_size():
+        '''
+        Get the size of the terminal
+        
+        @return  :(int, int)  The height and the width of the terminal
+        '''
+        try:
+            (width, height) = os.get_terminal_size(sys.stdout.fileno())
+        except OSError:
+            height_width = Popen('stty size'.split(' '), stdout = PIPE, stderr = PIPE).communicate()[0]
+            (height, width) = height_width.decode('utf-8', 'strict')[:-1].split(' ')
+        return (max(int(height), 1), int(width))
+    
+    
+    def autocollapse(self, feed):
+        '''
+        Collapse a branch, and all branches inside it, unless
+        it has new entries, branches that have not been created
+        yet are collapsed when they are created
+        
+        @param  feed:dict<str, _|int|itr<↑>>  The node
+        '''
+        if 'inner' in feed:
+            if ('new' not in feed) or (feed['new'] == 0):
+                feed['expanded'] = False
+                self.collapsed_count += 1
+            if 'materialise' not in feed:
+                [self.autocollapse(feed) for feed in feed['inner']]
+    
+    
+    def children(self, feed):
+        '''
+        Get the children of a branch
+        
+        A branch can be created without its children, in which case
+        it has the item 'materialise' mapped to a nullary function that
+        returns its children, and 'inner' mapped to `None`. The children
+        are created when they are first needed, which is when the branch
+        is expanded or navigated into. Such branches must have an up to
+        date 'new' value.
+        
+        @param   feed:dict<str, _|itr<↑>>    The branch
+        @return  :list<dict<str, _|itr<↑>>>  The children of the branch
+        '''
+        if 'materialise' in feed:
+            feed['inner'] = feed['materialise']()
+            del feed['materialise']
+            [self.autocollapse(child) for child in feed['inner']]
+        return feed['inner']
     
     
     @staticmethod
@@ -202,13 +537,16 @@ class Tree():
         '''
         Recursively count the number of new entries
         
+        The counts are otherwise kept up to date incrementally, see
+        `FeedIndex.propagate_new`, so this is only needed for repairs
+        
         @param   feeds:itr<dict<str, _|int|itr<↑>>>  The nodes to perform the count over
         @return  :int                                The number of new entries in the node and all its children
         '''
         rc = 0
         for feed in feeds:
             count = 0
-            if 'inner' in feed:
+            if ('inner' in feed) and ('materialise' not in feed):
                 count = Tree.count_new(feed['inner'])
                 feed['new'] = count
             elif 'new' in feed:
@@ -239,80 +577,159 @@ class Tree():
         return (node is not None) and ('inner' not in node)
     
     
-    def print_node(self, feed, last, indent, force):
+    def unread_path(self, nodes, start, downward):
+        '''
+        Find the first, or last, unread leaf in a list of trees
+        
+        Trees without anything new in them are skipped over rather
+        than searched, so only the path to the leaf is visited
+        
+        @param   nodes:list<dict<str, _|int|itr<↑>>>  The trees
+        @param   start:int                            The index of the first tree to search
+        @param   downward:bool                        Whether to search forward from `start`,
+                                                      rather than backward
+        @return  :list<(:dict<str, _>, :int)>?        The path to the leaf, as in `select_stack`,
+                                                      `None` if there is no unread leaf
+        '''
+        step = 1 if downward else -1
+        i = start
+        while 0 <= i < len(nodes):
+            node = nodes[i]
+            if ('new' in node) and (node['new'] > 0):
+                # Found it?
+                if 'inner' not in node:
+                    return [(node, i)]
+                # Otherwise, search inside the branch.
+                inner = self.children(node)
+                path = self.unread_path(inner, 0 if downward else len(inner) - 1, downward)
+                if path is not None:
+                    return [(node, i)] + path
+            i += step
+        return None
+    
+    
+    def find_unread(self, downward):
+        '''
+        Find the next, or previous, unread leaf, starting over
+        at the other end of the tree if there is none
+        
+        The new-article counts on the branches are used to skip
+        all branches without unread leaves, so the time of the
+        search is proportional to the depth of the tree and
+        the number of children of the visited branches, rather
+        than to the size of the tree
+        
+        @param   downward:bool                  Whether to find the next leaf, rather than the previous
+        @return  :list<(:dict<str, _>, :int)>?  The new selection stack, `None` if there is no unread leaf
+        '''
+        stack = self.select_stack
+        cur = stack[-1][0]
+        # The children of a branch are directly below it.
+        if downward and (cur is not None) and ('inner' in cur):
+            path = self.unread_path(self.children(cur), 0, True)
+            if path is not None:
+                return stack + path
+        # Search the nodes after (before) the node in its branch,
+        # and then those after (before) each of its ancestors.
+        for level in range(len(stack) - 1, 0, -1):
+            curi = stack[level][1]
+            par = stack[level - 1][0]
+            par = self.feeds if par is None else self.children(par)
+            path = self.unread_path(par, curi + (1 if downward else -1), downward)
+            if path is not None:
+                return stack[:level] + path
+        # Start over at the other end of the tree.
+        path = self.unread_path(self.feeds, 0 if downward else len(self.feeds) - 1, downward)
+        return None if path is None else stack[:1] + path
+    
+    
+    def upcoming_unread(self, count):
+        '''
+        Find the unread leaves that would be selected next by `find_unread`
+        
+        @param   count:int            The maximum number of leaves to find
+        @return  :list<dict<str, _>>  The leaves, in the order they would be selected
+        '''
+        stack = self.select_stack
+        leaves = []
+        try:
+            while len(leaves) < count:
+                path = self.find_unread(True)
+                # Stop when we are back where we started.
+                if (path is None) or (path[-1][0] is stack[-1][0]):
+                    break
+                if any(path[-1][0] is leaf for leaf in leaves):
+                    break
+                leaves.append(path[-1][0])
+                self.select_stack = path
+        finally:
+            self.select_stack = stack
+        return leaves
+    
+    
+    def print_node(self, feed, last, indent):
         '''
-        Print a node and its children
+        Render a node and its children into the frame
         
         @param   feed:dict<str, _|itr<↑>|str|int>  The node to print
         @param   last:bool                         Whether the node is the last child in its parent
         @param   indent:str                        The indent string for the parent
-        @param   force:bool                        Whether to print even if marked as printed
         '''
         global height, width
         
-        # What is the title on the node?
-        title = feed['title']
+        # Nothing more to do if the rest of the screen has been
+        # rendered and we know where the selected node is.
+        if (self.line is not None) and (self.curline >= self.lineoff + height):
+            return
+        
+        # Remember where the selected node is.
+        selected = self.select_stack[-1][0] is feed
+        if selected:
+            self.line = self.curline
         
         # Is the node a collapsed branch?
         collapsed = ('inner' in feed) and not Tree.is_expanded(feed)
         
-        # What should be printed at the beginning of the line to make it look like a tree?
-        prefix = indent + ('└' if last else '├')
-        if collapsed:
-            prefix += '─┘ ' if self.islinux else '─┚ '
-        else:
-            prefix += '── ' if self.islinux else '─╼ '
-        
-        # Anything new in the node?
-        has_new = ('new' in feed) and (feed['new'] > 0)
-        if has_new:
-            prefix += '\033[01;31m(%i)\033[00m ' % feed['new']
-        
-        # Truncate title if it is too long.
-        prefixlen = len('%s--- %s' % (indent, ('(%i) ' % feed['new']) if has_new else ''))
-        if prefixlen + len(title) > width:
-            if width - prefixlen - 3 >= 0:
-                title = title[:width - prefixlen - 3] + '...'
-        
-        # Get the colour, and selection highlight, for the node.
-        if 'colour' in feed:
-            if self.select_stack[-1][0] is feed:
-                title = '\033[01;3%im%s\033[00m' % (feed['colour'], title)
-            else:
-                title = '\033[3%im%s\033[00m' % (feed['colour'], title)
-        elif self.select_stack[-1][0] is feed:
-            title = '\033[01;34m%s\033[00m' % title
-        
-        # Draw the node.
+        # Render the node, if it is visible.
         if self.lineoff <= self.curline < self.lineoff + height:
-            if self.curline > self.lineoff:
-                print()
-            if force or ('draw_line' not in feed) or (feed['draw_line'] != self.draw_line):
-                print('\033[2K', end = prefix + title)
-                feed['draw_line'] = self.draw_line
-            self.draw_line += 1
-        else:
-            feed['draw_line'] = -1
+            # What is the title on the node?
+            title = feed['title']
+            
+            # What should be printed at the beginning of the line to make it look like a tree?
+            key = (indent, last, collapsed)
+            if key not in self.prefixes:
+                self.prefixes[key] = indent + PREFIXES[self.islinux][(last, collapsed)]
+            prefix = self.prefixes[key]
+            
+            # Anything new in the node?
+            has_new = ('new' in feed) and (feed['new'] > 0)
+            if has_new:
+                prefix += '\033[01;31m(%i)\033[00m ' % feed['new']
+            
+            # Truncate title if it is too long.
+            prefixlen = len(indent) + 4 + (len('(%i) ' % feed['new']) if has_new else 0)
+            if prefixlen + len(title) > width:
+                if width - prefixlen - 3 >= 0:
+                    title = title[:width - prefixlen - 3] + '...'
+            
+            # Get the colour, and selection highlight, for the node.
+            if 'colour' in feed:
+                if selected:
+                    title = '\033[01;3%im%s\033[00m' % (feed['colour'], title)
+                else:
+                    title = '\033[3%im%s\033[00m' % (feed['colour'], title)
+            elif selected:
+                title = '\033[01;34m%s\033[00m' % title
+            
+            self.rows.append(prefix + title)
         self.curline += 1
         
-        # Was the the select node not printed yet?
-        if self.line >= 0:
-            # Remember that that we just draw the a lnie.
-            self.line += 1
-            # Select node not printed yet, now?
-            if self.select_stack[-1][0] is feed:
-                self.line = ~self.line
-        
-        # Draw children.
-        if 'inner' in feed:
-            if collapsed:
-                feed['draw_expanded'] = False
-            else:
-                inner = feed['inner']
-                _force = force or not feed['draw_expanded']
-                feed['draw_expanded'] = True
-                for feed in inner:
-                    self.print_node(feed, feed is inner[-1], indent + ('    ' if last else '│   '), _force)
+        # Render children.
+        if ('inner' in feed) and not collapsed:
+            inner = self.children(feed)
+            indent += INDENTS[last]
+            for feed in inner:
+                self.print_node(feed, feed is inner[-1], indent)
     
     
     def print_tree(self):
@@ -320,73 +737,97 @@ class Tree():
         Print the entire tree
         '''
         global height, width
+        start = time.perf_counter()
         
-        # Reset line pointers.
-        self.line = 0
-        self.curline = 0
-        
-        # Get the size of the terminal.
-        height_width = Popen('stty size'.split(' '), stdout = PIPE, stderr = PIPE).communicate()[0]
-        (height, width) = height_width.decode('utf-8', 'strict')[:-1].split(' ')
-        height, width = int(height), int(width)
-        
-        # Do we need to redraw the currentöy and the previously selected line.
-        if self.last_select is not self.select_stack[-1][0]:
-            if self.last_select is not None:
-                self.last_select['draw_line'] = -1
-            if self.select_stack[-1][0] is not None:
-                self.select_stack[-1][0]['draw_line'] = -1
+        # Get the size of the terminal, everything must be redrawn if it has changed.
+        (height, width) = Tree.terminal_size()
+        if self.frame_size != (height, width):
+            self.frame_size = (height, width)
+            self.draw_force = True
         
-        # Go to top of screen, clear if redrawing.
-        print('\033[H', end = '')
-        if self.draw_force:
-            print('\033[2J', end = '')
-        # Ge the title of the root, and selection highlight colour.
+        # Get the title of the root, and selection highlight colour.
         title = self.root
         if len(self.select_stack) == 1:
             title = '\033[01;34m%s\033[00m' % title
-        # Draw the root.
-        root, self.redraw_root = self.redraw_root, False
-        if root or self.lineoff <= self.curline < self.lineoff + height:
-            if root or self.draw_force or ((self.last_select is not None) == (self.select_stack[-1][0] is None)):
-                print('\033[K', end = '')
-                if self.count > 0:
-                    print('\033[01;31m(%i)\033[00m ' % self.count, end = '')
-                print(title, end = '')
-        self.line += 1
-        self.curline += 1
-        # At root? It as been printed.
-        if len(self.select_stack) == 1:
-            self.line = ~self.line
-        self.draw_line = 1
-        # Draw children.
-        for feed in self.feeds:
-            self.print_node(feed, feed is self.feeds[-1], '', self.draw_force)
-        # Clear the rest of the screen, there is nothing there.
-        if self.draw_line < height:
-            print('\n\033[J', end = '')
-        sys.stdout.flush()
-        
-        # Remember which node is selected.
-        self.last_select = self.select_stack[-1][0]
-        
-        # Was the selected node visible?
-        self.line = ~self.line
-        if not (self.lineoff < self.line <= self.lineoff + height):
-            # No. Then:
-            # Adjust vision field so the select node is centered..
-            self.lineoff = self.line - height // 2
-            # If not possible to center, go to boundary.
-            if not (self.lineoff < self.line <= self.lineoff + height):
-                self.lineoff -= 1
-            if self.lineoff < 0:
-                self.lineoff = 0
-            # Drawn
-            self.draw_force = True
-            self.print_tree()
+        if self.count > 0:
+            title = '\033[01;31m(%i)\033[00m %s' % (self.count, title)
+        
+        while True:
+            # Reset line pointers and the frame.
+            self.rows = []
+            self.line = 0 if len(self.select_stack) == 1 else None
+            self.curline = 0
+            # Render the root.
+            if self.lineoff == 0:
+                self.rows.append(title)
+            self.curline += 1
+            # Render children.
+            for feed in self.feeds:
+                self.print_node(feed, feed is self.feeds[-1], '')
+            # Was the selected node visible?
+            if (self.line is None) or (self.lineoff <= self.line < self.lineoff + height):
+                break
+            # No. Then adjust vision field so the select node is centered,
+            # or if not possible to center, go to boundary.
+            self.lineoff = max(self.line - height // 2, 0)
         
-        # Forced redraw has been applied (if it was requeted.)
+        # Print the frame.
+        self.print_frame()
+        self.draw_pending = False
+        self.draw_time = time.monotonic()
+        profiler.record('print tree', time.perf_counter() - start)
+    
+    
+    def print_frame(self):
+        '''
+        Print the lines in the rendered frame that differs from
+        those on the screen, using a single write
+        '''
+        # Clear the screen if redrawing, and forget what is on it.
+        buf = []
+        if self.draw_force:
+            buf.append('\033[H\033[2J')
+            self.frame = []
+        # Print changed lines.
+        for y in range(len(self.rows)):
+            if (y >= len(self.frame)) or not (self.rows[y] == self.frame[y]):
+                buf.append('\033[%i;1H\033[2K%s' % (y + 1, self.rows[y]))
+        # Clear the rest of the screen, there is nothing there.
+        if len(self.rows) < len(self.frame):
+            buf.append('\033[%i;1H\033[J' % (len(self.rows) + 1))
+        # Remember what is on the screen.
+        self.frame = self.rows
         self.draw_force = False
+        if len(buf) > 0:
+            sys.stdout.write(''.join(buf))
+            sys.stdout.flush()
+    
+    
+    def read_key(self):
+        '''
+        Get the next byte of input
+        
+        The tree is only printed, if it has changed, when there is no more
+        pending input or when it has not been printed for `REDRAW_INTERVAL`
+        seconds. Only one byte is read at a time, so input typed ahead is
+        left for whatever reads the terminal next, a prompt or a pager
+        
+        @return  :str  The byte, as a character
+        '''
+        fd = sys.stdin.fileno()
+        pending = len(select.select([fd], [], [], 0)[0]) > 0
+        # Print the tree if it has changed and the user is not waiting for it.
+        if self.draw_pending:
+            if (not pending) or (time.monotonic() - self.draw_time >= REDRAW_INTERVAL):
+                self.print_tree()
+        # Let the owner of the tree do some work if the user is idle.
+        if (not pending) and (self.idle is not None):
+            if len(select.select([fd], [], [], self.idle[0])[0]) == 0:
+                self.idle[1]()
+        key = os.read(fd, 1)
+        if len(key) == 0:
+            raise EOFError()
+        return chr(key[0])
     
     
     def interact(self):
@@ -397,8 +838,8 @@ class Tree():
         '''
         global height, width
 
-        # Print the tree.
-        self.print_tree()
+        # Print the tree when there is no pending input.
+        self.draw_pending = True
         
         # Ring buffer for input.
         buf = '\0' * 10
@@ -409,7 +850,7 @@ class Tree():
         while True:
             # Get input.
             if queued == '':
-                buf += chr(sys.stdin.buffer.read(1)[0])
+                buf += self.read_key()
             else:
                 buf += queued[:1]
                 queued = queued[1:]
@@ -462,7 +903,7 @@ class Tree():
                                 # At expanded branch?
                                 if ('inner' in cur) and Tree.is_expanded(cur):
                                     # Visit first child.
-                                    self.select_stack.append((cur['inner'][0], 0))
+                                    self.select_stack.append((self.children(cur)[0], 0))
                                     tline += 1
                                 # At leaf or collapsed branch?
                                 else:
@@ -471,7 +912,7 @@ class Tree():
                                     while len(self.select_stack) > 1:
                                         # Get parent.
                                         par = self.select_stack[-2][0]
-                                        par = self.feeds if par is None else par['inner']
+                                        par = self.feeds if par is None else self.children(par)
                                         # We are no longer visiting the node.
                                         self.select_stack.pop()
                                         # Is there another node in the branch?
@@ -503,7 +944,7 @@ class Tree():
                         # Otherwise...
                         else:
                             # ... redraw the the retree.
-                            self.print_tree()
+                            self.draw_pending = True
                     # Did no click on a node? Revert.
                     else:
                         self.select_stack[:] = backup
@@ -519,17 +960,17 @@ class Tree():
                     if curi > 0:
                         # Get parent.
                         par = self.select_stack[-1][0]
-                        par = self.feeds if par is None else par['inner']
+                        par = self.feeds if par is None else self.children(par)
                         # Go to previous node.
                         curi -= 1
                         cur = par[curi]
                         self.select_stack.append((cur, curi))
                         # If the previous node is a branch, find its visible last node.
                         while ('inner' in cur) and Tree.is_expanded(cur):
-                            curi = len(cur['inner']) - 1
-                            cur = cur['inner'][curi]
+                            curi = len(self.children(cur)) - 1
+                            cur = self.children(cur)[curi]
                             self.select_stack.append((cur, curi))
-                    self.print_tree()
+                    self.draw_pending = True
             
             # C-up.
             elif buf.endswith('\033[1;5A'):
@@ -542,9 +983,9 @@ class Tree():
                     if curi > 0:
                         # ... go to the previous node.
                         par = self.select_stack[-1][0]
-                        par = self.feeds if par is None else par['inner']
+                        par = self.feeds if par is None else self.children(par)
                         self.select_stack.append((par[curi - 1], curi - 1))
-                    self.print_tree()
+                    self.draw_pending = True
             
             # Down.
             elif buf.endswith('\033[B'):
@@ -553,15 +994,15 @@ class Tree():
                     # Go to first node.
                     if len(self.feeds) > 0:
                         self.select_stack.append((self.feeds[0], 0))
-                        self.print_tree()
+                        self.draw_pending = True
                 # Not at root?
                 else:
                     (cur, curi) = self.select_stack[-1]
                     # At expanded branch?
                     if ('inner' in cur) and Tree.is_expanded(cur):
                         # Go to first child
-                        self.select_stack.append((cur['inner'][0], 0))
-                        self.print_tree()
+                        self.select_stack.append((self.children(cur)[0], 0))
+                        self.draw_pending = True
                     # At leaf or or collapsed branch?
                     else:
                         # Back up the current selection stack.
@@ -570,7 +1011,7 @@ class Tree():
                         while len(self.select_stack) > 1:
                             # Get parent.
                             par = self.select_stack[-2][0]
-                            par = self.feeds if par is None else par['inner']
+                            par = self.feeds if par is None else self.children(par)
                             # We are no longer at the current node.
                             self.select_stack.pop()
                             # If there is a next node in the branch...
@@ -578,7 +1019,7 @@ class Tree():
                                 # ... go to it.
                                 self.select_stack.append((par[curi + 1], curi + 1))
                                 backup = None
-                                self.print_tree()
+                                self.draw_pending = True
                                 break
                             # ... otherwise retry from the parent.
                             (cur, curi) = self.select_stack[-1]
@@ -594,13 +1035,13 @@ class Tree():
                     # Get current node, and parent.
                     (cur, curi) = self.select_stack[-1]
                     par = self.select_stack[-2][0]
-                    par = self.feeds if par is None else par['inner']
+                    par = self.feeds if par is None else self.children(par)
                     # Not at the current last node in the branch?
                     if curi + 1 < len(par):
                         # Go to the next node.
                         self.select_stack.pop()
                         self.select_stack.append((par[curi + 1], curi + 1))
-                        self.print_tree()
+                        self.draw_pending = True
                         break
                     # At last node in branch.
                     elif self.select_stack[-2][0] is not None:
@@ -621,7 +1062,7 @@ class Tree():
                     # Go to first node.
                     if len(self.feeds) > 0:
                         self.select_stack.append((self.feeds[0], 0))
-                        self.print_tree()
+                        self.draw_pending = True
                 # Not at root?
                 else:
                     # Go to first child.
@@ -631,8 +1072,8 @@ class Tree():
                             # Expand branch whence we came if collapsed.
                             cur['expanded'] = True
                             self.collapsed_count -= 1
-                        self.select_stack.append((cur['inner'][0], 0))
-                        self.print_tree()
+                        self.select_stack.append((self.children(cur)[0], 0))
+                        self.draw_pending = True
             
             # C-right
             elif buf.endswith('\033[1;5C'):
@@ -655,25 +1096,25 @@ class Tree():
                                 # Expand branch whence we came if collapsed.
                                 cur['expanded'] = True
                                 self.collapsed_count -= 1
-                            self.select_stack.append((cur['inner'][0], 0))
+                            self.select_stack.append((self.children(cur)[0], 0))
                         else:
                             break
                 # Redraw if we have moved.
                 if len(self.select_stack) != stacksize:
-                    self.print_tree()
+                    self.draw_pending = True
             
             # Left.
             elif buf.endswith('\033[D'):
                 # Go to parent.
                 if len(self.select_stack) > 1:
                     self.select_stack.pop()
-                    self.print_tree()
+                    self.draw_pending = True
             
             # C-left.
             elif buf.endswith('\033[1;5D'):
 		# Go to root.
                 self.select_stack[:] = self.select_stack[:1]
-                self.print_tree()
+                self.draw_pending = True
             
             # Space or, not at a branch, enter.
             elif buf.endswith(' ') or (buf.endswith('\n') and not Tree.is_leaf(self.select_stack[-1][0])):
@@ -687,8 +1128,9 @@ class Tree():
                             if cur_value != value:
                                 feed['expanded'] = value
                                 self.collapsed_count += -1 if value else 1
-                            for inner in feed['inner']:
-                                expand(inner, value)
+                            if value or ('materialise' not in feed):
+                                for inner in self.children(feed):
+                                    expand(inner, value)
                     value = self.collapsed_count != 0
                     for feed in self.feeds:
                         expand(feed, value)
@@ -701,14 +1143,13 @@ class Tree():
                         value = not Tree.is_expanded(cur)
                         self.collapsed_count += -1 if value else 1
                         cur['expanded'] = value
-                        cur['draw_line'] = -1
-                self.print_tree()
+                self.draw_pending = True
             
             # C-l.
             elif buf.endswith(chr(ord('L') - ord('@'))):
                 # Redraw everything.
                 self.draw_force = True
-                self.print_tree()
+                self.draw_pending = True
             
             # n, P, N, or p. (Jump to unread leaf.)
             elif buf.endswith('n') or buf.endswith('P') or buf.endswith('N') or buf.endswith('p'):
@@ -718,84 +1159,18 @@ class Tree():
                 # Which direction?
                 downward = buf.endswith('n') or buf.endswith('P')
                 # Locate next/previous unread leaf.
-                while True:
-                    cur = self.select_stack[-1][0]
-                    # At root.
-                    if cur is None:
-                        # Test first node.
-                        if downward:
-                            self.select_stack.append((self.feeds[0], 0))
-                        # Test last node.
-                        else:
-                            self.select_stack.append((self.feeds[-1], len(self.feeds) - 1))
-                            while 'inner' in self.select_stack[-1][0]:
-                                inners = self.select_stack[-1][0]['inner']
-                                self.select_stack.append((inners[-1], len(inners) - 1))
-                    # Find next.
-                    elif downward:
-                        curi = self.select_stack[-1][1]
-                        # On branch? Visit its children.
-                        if 'inner' in cur:
-                            self.select_stack.append((cur['inner'][0], 0))
-                        # Otherwise, test next, possibility and ancestors next.
-                        else:
-                            restart = True
-                            # While we are not at root.
-                            while len(self.select_stack) > 1:
-                                # Get parent.
-                                par = self.select_stack[-2][0]
-                                par = self.feeds if par is None else par['inner']
-                                # We are no longer at current node.
-                                self.select_stack.pop()
-                                # Not at the last node in the branch?
-                                if curi + 1 < len(par):
-                                    # Select the next one.
-                                    self.select_stack.append((par[curi + 1], curi + 1))
-                                    restart = False
-                                    break
-                                (cur, curi) = self.select_stack[-1]
-                            # Go to root if we have test everything below the
-                            # current node, and continue search from there.
-                            if restart:
-                                self.select_stack[:] = self.select_stack[:1]
-                                continue
-                    # Find previous.
-                    else:
-                        curi = self.select_stack[-1][1]
-                        # We are not longer at the current node.
-                        self.select_stack.pop()
-                        # Not at the first node in the branch?
-                        if curi > 0:
-                            # Get parent.
-                            par = self.select_stack[-1][0]
-                            par = self.feeds if par is None else par['inner']
-                            # Got to previous node.
-                            curi -= 1
-                            cur = par[curi]
-                            self.select_stack.append((cur, curi))
-                            # Is it a branch?
-                            while 'inner' in cur:
-                                # Select the last node in that branch.
-                                curi = len(cur['inner']) - 1
-                                cur = cur['inner'][curi]
-                                self.select_stack.append((cur, curi))
-                                # Repeat, if the new node is also a branch.
-                        # Reached the root? Start over, beginning search at the last node in the tree.
-                        if self.select_stack[-1][0] is None:
-                            continue
-                    # Is the leaf unread?
-                    cur = self.select_stack[-1][0]
-                    if ('inner' not in cur) and ('new' in cur) and (cur['new'] > 0):
-                        break
+                stack = self.find_unread(downward)
+                if stack is None:
+                    continue
+                self.select_stack[:] = stack
                 # Expand collapsed ancestors of the unread leaf.
                 for stack_item in self.select_stack[1:]:
                     stack_item = stack_item[0]
                     if not Tree.is_expanded(stack_item):
                         stack_item['expanded'] = True
                         self.collapsed_count -= 1
-                        self.draw_force = True
                 # Draw.
-                self.print_tree()
+                self.draw_pending = True
             
             # Normal keypress.
             elif (buf[-2] not in '[;') and (buf[-1] in ACTION_MAP):
@@ -18,49 +18,236 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 import os
 import time
+import hashlib
+import multiprocessing
 from subprocess import Popen, PIPE
 
 from common import *
 from flocker import *
 from parser import *
+from store import *
+from profiler import *
 
 ### Feed updater. ###
 
 
 
-def fetch_file(url):
+CHUNK_SIZE = 64 << 10
+'''
+:int  The maximum number of bytes to read from a feed at a time
+'''
+
+
+STOP_AFTER_KNOWN = 10
+'''
+:int  The number of consecutive, already fetched, articles after which the rest
+      of a feed is not parsed, if the feed lists the latest articles first
+'''
+
+
+record_directory = None
+'''
+:str?  The directory to save fetched files in, with their response headers, `None` not to
+'''
+
+replay_directory = None
+'''
+:str?  The directory to serve fetches from, rather than the network, `None` not to
+'''
+
+replay_latency = {}
+'''
+:dict<str, float>  Map from hosts, and '*' for other hosts, to the number of seconds
+                   to wait before serving a fetch from the host when replaying
+'''
+
+
+def record_fetches(directory):
     '''
-    Fetches a files, local or remote
+    Save every fetched file, and its response headers, in a directory, for `replay_fetches`
     
-    @param   url:str  The URL of the file
-    @retrun  :str     The content of the file
+    @param  directory:str  The directory, it is created if missing
+    '''
+    global record_directory
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    record_directory = directory
+
+
+def replay_fetches(directory):
+    '''
+    Serve fetches from files saved by `record_fetches`, rather than the network
+    
+    If the directory has a file named 'latency', with a host and a number of
+    seconds on each line, the fetches from those hosts are delayed as much,
+    '*' can be used as the host to delay fetches from all other hosts
+    
+    @param  directory:str  The directory
+    '''
+    global replay_directory
+    replay_directory = directory
+    replay_latency.clear()
+    latency = read_file('%s/latency' % directory)
+    for line in ([] if latency is None else latency.decode('utf-8', 'strict').split('\n')):
+        if not line.strip() == '':
+            (host, seconds) = line.split()
+            replay_latency[host] = float(seconds)
+
+
+def recording_pathname(directory, url):
+    '''
+    Get the pathname of the recording of a fetch, without the suffix,
+    which is '.body' for the file and '.headers' for the URL and headers
+    
+    @param   directory:str  The directory of recordings
+    @param   url:str        The URL of the file
+    @return  :str           The pathname, without suffix
+    '''
+    return '%s/%s' % (directory, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+
+def fetch_live(url, headers):
+    '''
+    Fetches a file, local or remote, piece by piece as it is read
+    
+    Closing the iterator early stops the download
+    
+    @param   url:str            The URL of the file
+    @param   headers:list<str>  List to which the response headers are added, when
+                                the download is complete, nothing is added for local
+                                files, `None` if they are not wanted
+    @return  :itr<bytes>        The content of the file, in pieces, nothing if a local file is missing
     '''
-    data = None
     if url.startswith('file://'):
         url = url[len('file://'):]
         if os.access(url, os.F_OK):
             with open(url, 'rb') as file:
-                data = file.read().decode('utf-8', 'strict')
+                while True:
+                    chunk = file.read(CHUNK_SIZE)
+                    if len(chunk) == 0:
+                        break
+                    yield chunk
     else:
-        data = Popen(['wget', url, '-O', '-'], stdout = PIPE).communicate()[0]
+        if headers is None:
+            proc = Popen(['wget', url, '-O', '-'], stdout = PIPE)
+        else:
+            # The response headers are printed, indented, with the
+            # progress, which is kept short, the headers are small.
+            proc = Popen(['wget', '-nv', '-S', url, '-O', '-'], stdout = PIPE, stderr = PIPE)
+        try:
+            while True:
+                chunk = proc.stdout.read1(CHUNK_SIZE)
+                if len(chunk) == 0:
+                    break
+                yield chunk
+            if headers is not None:
+                log = proc.stderr.read().decode('utf-8', 'replace').split('\n')
+                headers.extend(line.strip() for line in log if line.startswith('  '))
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            if headers is not None:
+                proc.stderr.close()
+            proc.wait()
+
+
+def fetch_recorded(url):
+    '''
+    Fetches a file, piece by piece, from the recordings, see `replay_fetches`
+    
+    @param   url:str      The URL of the file
+    @return  :itr<bytes>  The content of the file, in pieces, nothing if it was not recorded
+    '''
+    host = url.split('://', 1)[-1].split('/', 1)[0]
+    latency = replay_latency[host] if host in replay_latency else replay_latency.get('*', 0)
+    if latency > 0:
+        time.sleep(latency)
+    pathname = '%s.body' % recording_pathname(replay_directory, url)
+    if os.access(pathname, os.F_OK):
+        with open(pathname, 'rb') as file:
+            while True:
+                chunk = file.read(CHUNK_SIZE)
+                if len(chunk) == 0:
+                    break
+                yield chunk
+
+
+def fetch_recording(url):
+    '''
+    Fetches a file, local or remote, piece by piece as it is read, and
+    save it, and its response headers, see `record_fetches`
+    
+    The file is downloaded to the end, even if the iterator is closed early
+    
+    @param   url:str      The URL of the file
+    @return  :itr<bytes>  The content of the file, in pieces, nothing if a local file is missing
+    '''
+    pathname = recording_pathname(record_directory, url)
+    tmp = '%s.body.tmp.%i' % (pathname, os.getpid())
+    headers = []
+    chunks = fetch_live(url, headers)
+    with open(tmp, 'wb') as file:
+        try:
+            for chunk in chunks:
+                file.write(chunk)
+                yield chunk
+        except GeneratorExit:
+            pass
+        # Save all of the file, even if the caller stopped early, so it can be replayed in full.
+        for chunk in chunks:
+            file.write(chunk)
+    # Do not record missing local files, they are missing when replayed too.
+    if url.startswith('file://') and not os.access(url[len('file://'):], os.F_OK):
+        os.unlink(tmp)
+        return
+    os.rename(tmp, '%s.body' % pathname)
+    save_file('%s.headers' % pathname, ''.join('%s\n' % line for line in [url] + headers).encode('utf-8'), False)
+
+
+def fetch_chunks(url):
+    '''
+    Fetches a file, local or remote, piece by piece as it is read,
+    from the recordings instead if replaying, see `replay_fetches`
+    
+    Closing the iterator early stops the download, unless recording
+    
+    @param   url:str      The URL of the file
+    @return  :itr<bytes>  The content of the file, in pieces, nothing if a local file is missing
+    '''
+    if replay_directory is not None:
+        return profiler.timed('fetch', fetch_recorded(url))
+    if record_directory is not None:
+        return profiler.timed('fetch', fetch_recording(url))
+    return profiler.timed('fetch', fetch_live(url, None))
+
+
+def fetch_file(url):
+    '''
+    Fetches a file, local or remote
+    
+    @param   url:str  The URL of the file
+    @return  :bytes?  The content of the file, `None` if a local file is missing,
+                      or if the file was not recorded when replaying
+    '''
+    data = b''.join(fetch_chunks(url))
+    if replay_directory is not None:
+        if not os.access('%s.body' % recording_pathname(replay_directory, url), os.F_OK):
+            return None
+    elif url.startswith('file://') and not os.access(url[len('file://'):], os.F_OK):
+        return None
     return data
 
 
-def update_feed(feed, if_group, now = None):
+def select_leaves(feed, if_group, leaves):
     '''
-    Update a feed and its subfeeds
+    Find the feeds, among a feed and its subfeeds, that should be updated
     
     @param  feed:dict<str, _|int|itr<↑>>  The feed
     @param  if_group:str?                 The name of the group the feed should belong to
                                           for it to be updated, `None` to update everything
-    @param  now:tuple(int)?               The current time, intended for internal use
+    @param  leaves:list<dict>             List to which the feeds to update are added
     '''
-    # Get the current time.
-    if now is None:
-        now = time.gmtime()
-        now = [now.tm_year, now.tm_mon, now.tm_mday, now.tm_hour, now.tm_min, now.tm_sec]
-    
-    # Update node.
     if 'inner' in feed:
         # This is a branch.
         
@@ -68,86 +255,193 @@ def update_feed(feed, if_group, now = None):
         if feed['group'] == if_group:
             if_group = None
         
-        # Update all children.
+        # Search all children.
         for feed in feed['inner']:
-            update_feed(feed, if_group, now)
+            select_leaves(feed, if_group, leaves)
         
     elif ((if_group is None) or (feed['group'] == if_group)) and ('url' in feed) and (feed['url'] is not None):
         # This is a leaf, it has an url, and is no the selected group.
+        leaves.append(feed)
+
+
+def read_feed_info(metafile, url):
+    '''
+    Parse the metadata file of a feed, the caller must hold a lock on the file
+    
+    @param   metafile:str        The pathname of the metadata file
+    @param   url:str             The URL of the feed, used if the metadata does not have it
+    @return  :dict<str, _>       The metadata, with 'have', 'unread' and 'url' defaulted
+    '''
+    with profiler.phase('metadata load'):
+        feed_info = read_file(metafile)
+        feed_info = '' if feed_info is None else feed_info.decode('utf-8', 'strict')
+        feed_info = eval(feed_info) if len(feed_info) > 0 else {}
+    
+    # Default missing metadata.
+    if 'have' not in feed_info:
+        feed_info['have'] = set()
+    if 'unread' not in feed_info:
+        feed_info['unread'] = set()
+    if 'url' not in feed_info:
+        feed_info['url'] = url
+    return feed_info
+
+
+def fetch_new_items(job):
+    '''
+    Fetch a feed, and find the articles that have not been fetched before
+    
+    This is the part of an update that is run in the worker processes, only
+    the new articles are sent back, and nothing is written
+    
+    @param   job:(int, str, str)        The index of the feed among those being updated,
+                                        its ID, and its URL
+    @return  :(int, list<dict<str, _>>?)  The index of the feed, and the new articles, in the
+                                          order they appear in the feed, `None` on failure
+    '''
+    (index, id, url) = job
+    metafile = '%s/%s' % (root, id)
+    try:
+        # Read the metadata, the lock is not kept while the feed is downloaded,
+        # instead new articles are checked against the metadata again when stored.
+        with touch('%s.lock' % metafile) as feed_flock:
+            flock(feed_flock, False)
+            feed_info = read_feed_info(metafile, url)
+            unflock(feed_flock)
+        have = feed_info['have']
         
-        # Get the ID if the node.
-        id = feed['id']
+        # Find new articles.
+        new_content = []
+        # Fetch and parse feed, item by item as it is downloaded,
+        # so only the new articles are kept in memory, and stop when
+        # we have reached the articles we already have.
+        items = iter_items(fetch_chunks(feed_info['url']), lambda guid : guid in have, STOP_AFTER_KNOWN)
+        for (_channel, item) in items:
+            if 'guid' not in item:
+                # Default GUID to the link, if missing.
+                item['guid'] = item['link' if 'link' in item else 'title']
+            if item['guid'] not in have:
+                have.add(item['guid'])
+                new_content.append(item)
+        return (index, new_content)
+    except:
+        return (index, None)
+
+
+def fetch_new_items_in_worker(job):
+    '''
+    Run `fetch_new_items` in a worker process
+    
+    @param   job:(int, str, str)                                   See `fetch_new_items`
+    @return  :(int, list<dict<str, _>>?, dict<str, list<float>>?)  The return of `fetch_new_items`, and the
+                                                                   durations collected by the profiler, see
+                                                                   `Profiler.drain`
+    '''
+    return fetch_new_items(job) + (profiler.drain(),)
+
+
+def store_new_items(feed, new_content, now):
+    '''
+    Store the new articles of a feed
+    
+    @param  feed:dict<str, _|int>           The feed
+    @param  new_content:list<dict<str, _>>  The articles, from `fetch_new_items`
+    @param  now:list<int>                   The current time
+    '''
+    # Get pathname.
+    metafile = '%s/%s' % (root, feed['id'])
+    
+    # Acquire feed...
+    with touch('%s.lock' % metafile) as feed_flock:
+        # ... and update.
         
-        # Get pathnames.
-        metafile = '%s/%s' % (root, id)
-        datafile = '%s/%s-content' % (root, id)
+        # Lock the feed file for writing.
+        flock(feed_flock, True)
         
-        # Acquire feed...
-        with touch(metafile) as feed_flock:
-            # ... and update.
-            
-            # Lock the feed file for writing.
-            flock(feed_flock, True)
-            
-            # Load feed metadata.
-            feed_info = None
-            with open(metafile, 'rb') as file:
-                feed_info = file.read().decode('utf-8', 'strict')
-            feed_info = eval(feed_info) if len(feed_info) > 0 else {}
-            
-            # Default missing metadata.
-            if 'have' not in feed_info:
-                feed_info['have'] = set()
-            if 'unread' not in feed_info:
-                feed_info['unread'] = set()
-            if 'url' not in feed_info:
-                feed_info['url'] = feed['url']
-            
-            # Fetch metadata.
-            have = feed_info['have']
-            unread = feed_info['unread']
-            url = feed_info['url']
-            updated = True
-            
-            # Update content.
-            try:
-                # Fetch feed.
-                feed_data = fetch_file(url)
-                feed_data = [] if feed_data is None else parse_feed(feed_data)
-                
-                # Create backup, and parse content.
-                bakdata = make_backup(datafile)
-                content = [] if bakdata is None else eval(bakdata.decode('utf-8', 'strict'))
-                
-                # Find new articles.
-                for channel in feed_data:
-                    for item in channel['items']:
-                        if 'guid' not in item:
-                            # Default GUID to the link, if missing.
-                            item['guid'] = item['link' if 'link' in item else 'title']
-                        guid = item['guid']
-                        if guid not in have:
-                            # Article is new, remember that/it.
-                            unread.add(guid)
-                            have.add(guid)
-                            content.append(item)
-                            # Default publication time to retrieval, if missing.
-                            if 'pubdate' not in item:
-                                item['pubdate'] = now
-                
-                # Update content file.
-                save_file(datafile, bakdata, lambda : repr(content).encode('utf-8'))
-            except:
-                updated = False
-            
-            # Update metadata.
-            if updated:
-                # Update metadata file.
-                bakdata = make_backup(metafile)
-                save_file(metafile, bakdata, lambda : repr(feed_info).encode('utf-8'));
-                # Update new-articles counter.
-                feed['new'] = len(unread)
-            
-            # Release lock over file, we are done here.
-            unflock(feed_flock)
+        # Load feed metadata.
+        feed_info = read_feed_info(metafile, feed['url'])
+        have = feed_info['have']
+        unread = feed_info['unread']
+        
+        # Another process may have stored some of the articles already.
+        new_content = [item for item in new_content if item['guid'] not in have]
+        for item in new_content:
+            # Article is new, remember that/it.
+            unread.add(item['guid'])
+            have.add(item['guid'])
+            # Default publication time to retrieval, if missing.
+            if 'pubdate' not in item:
+                item['pubdate'] = now
+            if 'timestamp' not in item:
+                item['timestamp'] = timestamp(item['pubdate'])
+        
+        # Append the new articles to the content log, rather than rewriting the
+        # content file, and merge the log into the file when it has grown large.
+        updated = True
+        try:
+            if len(new_content) > 0:
+                log_records(feed['id'], [('add', item) for item in new_content])
+            compact_content(feed['id'])
+        except:
+            updated = False
+        
+        # Update metadata.
+        if updated:
+            # Update metadata file.
+            with profiler.phase('metadata save'):
+                save_file(metafile, repr(feed_info).encode('utf-8'))
+            # Update new-articles counter.
+            feed['new'] = len(unread)
+        
+        # Release lock over file, we are done here.
+        unflock(feed_flock)
+
 
+def update_feeds_in_pool(feeds, if_group, jobs = 1):
+    '''
+    Update feeds and their subfeeds
+    
+    @param  feeds:itr<dict<str, _|int|itr<↑>>>  The feeds
+    @param  if_group:str?                       The name of the group the feeds should belong to
+                                                for them to be updated, `None` to update everything
+    @param  jobs:int                            The number of processes to fetch and parse feeds in,
+                                                0 for one per CPU, 1 to do everything in this process
+    '''
+    # Get the current time.
+    now = time.gmtime()
+    now = [now.tm_year, now.tm_mon, now.tm_mday, now.tm_hour, now.tm_min, now.tm_sec]
+    
+    # Find the feeds to update.
+    leaves = []
+    for feed in feeds:
+        select_leaves(feed, if_group, leaves)
+    work = [(index, feed['id'], feed['url']) for (index, feed) in enumerate(leaves)]
+    
+    # Parse in worker processes, but let this process alone write the
+    # new articles, as they come back, so writes are not interleaved.
+    jobs = (os.cpu_count() or 1) if jobs == 0 else jobs
+    if (jobs > 1) and (len(work) > 1):
+        # The workers must be forked, the program runs from a zip file without a
+        # main guard, so a spawned or forkserver worker would run it all over again.
+        with multiprocessing.get_context('fork').Pool(min(jobs, len(work))) as pool:
+            for (index, new_content, samples) in pool.imap_unordered(fetch_new_items_in_worker, work):
+                # Include the time spent in the worker in the profile.
+                profiler.merge(samples)
+                if new_content is not None:
+                    store_new_items(leaves[index], new_content, now)
+    else:
+        for job in work:
+            (index, new_content) = fetch_new_items(job)
+            if new_content is not None:
+                store_new_items(leaves[index], new_content, now)
+
+
+def update_feed(feed, if_group):
+    '''
+    Update a feed and its subfeeds
+    
+    @param  feed:dict<str, _|int|itr<↑>>  The feed
+    @param  if_group:str?                 The name of the group the feed should belong to
+                                          for it to be updated, `None` to update everything
+    '''
+    update_feeds_in_pool([feed], if_group)
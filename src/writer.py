@@ -0,0 +1,124 @@
+'''
+featherweight – A lightweight terminal news feed reader
+
+Copyright © 2013, 2014, 2015  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import threading
+
+### Background saving, so the user does not have to wait for locks. ###
+
+
+
+class Writer():
+    '''
+    A thread that performs persistence jobs in the order they were submitted
+    
+    A job is coalesced with the last waiting job if it is for the same file:
+    the file is only read and saved once, and all changes are applied in order
+    
+    @variable  order:list<(str, (list<_>)→void, list<_>)>      The waiting jobs, in order: their files,
+                                                               the functions that perform them, and
+                                                               the changes they shall apply
+    @variable  failures:list<(str, Exception)>                 Failed jobs, their files and errors,
+                                                               that have not been reported yet
+    @variable  busy:bool                                       Is a job being performed?
+    @variable  condition:threading.Condition                   Guards the other variables
+    @variable  thread:threading.Thread?                        The thread, `None` until the first job
+    '''
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.order = []
+        self.failures = []
+        self.busy = False
+        self.condition = threading.Condition()
+        self.thread = None
+    
+    
+    def submit(self, file, job, change):
+        '''
+        Queue a job
+        
+        @param  file:str                    The file the job modifies
+        @param  job:(changes:list<_>)→void  Function that locks, reads, and saves the file, applying
+                                            all changes in `changes`, the same function should be
+                                            used for all jobs on the same file
+        @param  change:_                    The change to apply
+        '''
+        with self.condition:
+            # Coalesce with the last waiting job if it is for the same file, coalescing
+            # with an earlier one would perform the change before jobs submitted before it.
+            if (len(self.order) > 0) and (self.order[-1][0] == file):
+                self.order[-1][2].append(change)
+            else:
+                self.order.append((file, job, [change]))
+            # Start the thread on the first job.
+            if self.thread is None:
+                self.thread = threading.Thread(target = self.run, daemon = True)
+                self.thread.start()
+            self.condition.notify_all()
+    
+    
+    def run(self):
+        '''
+        Perform jobs, forever
+        '''
+        while True:
+            # Wait for a job.
+            with self.condition:
+                while len(self.order) == 0:
+                    self.condition.wait()
+                (file, job, changes) = self.order.pop(0)
+                self.busy = True
+            # Perform the job, and remember it if it fails.
+            failure = None
+            try:
+                job(changes)
+            except Exception as err:
+                failure = (file, err)
+            with self.condition:
+                if failure is not None:
+                    self.failures.append(failure)
+                self.busy = False
+                self.condition.notify_all()
+    
+    
+    def wait(self):
+        '''
+        Wait until all jobs have been performed
+        '''
+        with self.condition:
+            while self.busy or (len(self.order) > 0):
+                self.condition.wait()
+    
+    
+    def report(self):
+        '''
+        Get, and forget, the jobs that have failed
+        
+        @return  :list<(str, Exception)>  The files and errors of the failed jobs
+        '''
+        with self.condition:
+            (failures, self.failures) = (self.failures, [])
+        return failures
+
+
+writer = Writer()
+'''
+:Writer  The writer used to save the files
+'''